@@ -0,0 +1,49 @@
+# ========================================
+# CONFIGURAÇÃO DO GUNICORN
+# Sistema de Orçamentos de Serviços
+#
+# Uso:
+#   gunicorn -c gunicorn.conf.py wsgi:application
+# ========================================
+
+import multiprocessing
+import os
+
+# Endereço/porta (Render e similares informam a porta em PORT)
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Um processo por núcleo (WEB_CONCURRENCY sobrescreve)
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# PostgreSQL: threads por worker para sobrepor espera de rede/banco.
+# SQLite (sem DATABASE_URL): workers síncronos, um escritor por vez no arquivo.
+if os.environ.get('DATABASE_URL'):
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+else:
+    worker_class = 'sync'
+
+# Recicla os workers periodicamente para limitar o crescimento de memória
+max_requests = 1000
+max_requests_jitter = 100
+
+timeout = 60
+
+# Arquivos do frontend: o send_file do Flask entrega o arquivo aberto ao wsgi.file_wrapper,
+# que no gunicorn usa sendfile(2) (cópia feita pelo kernel, sem passar pelo Python).
+# Só vale sem TLS no gunicorn; com HTTPS terminado num proxy à frente continua valendo.
+sendfile = True
+
+# Carrega a aplicação uma vez no processo mestre antes do fork: os workers sobem
+# mais rápido e compartilham (copy-on-write) a memória dos módulos já importados.
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Conexões do banco abertas no mestre não podem ser usadas pelos workers."""
+    from src.main import app
+    from src.models.models import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
@@ -4,10 +4,17 @@
 # ========================================
 
 import os
+import re
+import sqlite3
+import stat
 import sys
+from datetime import datetime
+from functools import lru_cache
 
-# Configuração necessária para importar os módulos
-sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Executado como script (python src/main.py): coloca a raiz do projeto no path para
+# importar o pacote src. Importado como src.main (gunicorn/wsgi, flask --app) não é necessário.
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Carrega variáveis de ambiente do arquivo .env (se existir)
 try:
@@ -21,14 +28,22 @@ except Exception as e:
     print(f"Erro ao carregar .env: {e}")
 
 # Importações do Flask e extensões
-from flask import Flask, jsonify, send_from_directory, send_file
+from flask import Flask, abort, jsonify, request, send_file
 from flask_login import LoginManager
 from flask_cors import CORS
 from flask_migrate import Migrate
-from sqlalchemy import inspect, text
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import safe_join
 
 # Importações dos nossos módulos
-from src.models.models import db, Usuario
+from src.models.models import db, PasswordResetToken, Usuario
+from src.utils.redis_utils import cliente_redis
+from src.utils.usuario_cache import obter_dados_usuario, armazenar_dados_usuario
+from src.utils.json_utils import ORJSONProvider
+from src.utils.compressao_utils import gerar_versoes_comprimidas, escolher_versao, tipo_do_arquivo
 from src.routes.auth import auth_bp
 from src.routes.clientes import clientes_bp
 from src.routes.servicos import servicos_bp
@@ -42,14 +57,69 @@ from src.routes.empresas import empresas_bp
 # ========================================
 
 # Cria a aplicação Flask
-app = Flask(__name__)
+# static_folder=None: /static/ é servido só pela rota serve_static (índice, versões comprimidas,
+# cache imutável). Com a pasta padrão, a rota embutida do Flask registrava a mesma URL antes dela.
+app = Flask(__name__, static_folder=None)
+
+# Modo de desenvolvimento, decidido já na importação: o Flask 2.3 só lê FLASK_DEBUG, mas
+# python src/main.py também aceita FLASK_ENV=development (e o app.run(debug=...) do final
+# só vale depois que o módulo inteiro, inclusive o WhiteNoise abaixo, já foi montado)
+MODO_DEBUG = (app.debug
+              or os.environ.get('FLASK_ENV') == 'development'
+              or os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes'))
+
+# Serialização JSON com orjson (Decimal e datetime convertidos no próprio encoder)
+app.json = ORJSONProvider(app)
+# Sem indentação nem em debug: respostas menores e o mesmo corpo em todos os ambientes
+app.json.compact = True
 
 # Configura CORS para permitir requisições do frontend
-CORS(app, origins=["http://localhost:3000"])
+# Origens lidas uma vez do ambiente (CORS_ORIGINS separado por vírgula). Com origens exatas
+# o navegador guarda o preflight por CORS_MAX_AGE segundos em vez de repeti-lo a cada chamada.
+CORS_ORIGINS = tuple(
+    origem.strip() for origem in os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',') if origem.strip()
+)
+CORS(app, origins=CORS_ORIGINS, supports_credentials=True,
+     max_age=int(os.environ.get('CORS_MAX_AGE', '600')))
+
+# Atrás de proxy/load balancer (Render, nginx): PROXY_COUNT = nº de proxies confiáveis à frente.
+# Sem isso request.remote_addr é o IP do proxy e os limites por IP valeriam para todos os clientes.
+PROXY_COUNT = int(os.environ.get('PROXY_COUNT', '0'))
+if PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT, x_proto=PROXY_COUNT)
 
 # Chave secreta para sessões (lida do ambiente; define padrão apenas em dev)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-nao-usar-em-producao')
 
+# Sessões no servidor (opcional, pip install Flask-Session + REDIS_URL): o cookie leva só o id
+# da sessão e o conteúdo fica no Redis, onde pode ser apagado para encerrar a sessão.
+# Sem os dois, vale a sessão padrão do Flask (cookie assinado).
+try:
+    from flask_session import Session
+    FLASK_SESSION_AVAILABLE = True
+except ImportError:
+    FLASK_SESSION_AVAILABLE = False
+
+if FLASK_SESSION_AVAILABLE and cliente_redis is not None:
+    app.config.update(
+        SESSION_TYPE='redis',
+        SESSION_REDIS=cliente_redis,
+        SESSION_PERMANENT=False,  # como o cookie padrão: vale até fechar o navegador
+        SESSION_KEY_PREFIX='sessao:',
+    )
+    Session(app)
+
+# Tamanho máximo do corpo das requisições (uploads de avatar/logo). Acima disso o werkzeug
+# recusa com 413 sem ler o resto, inclusive em envios chunked (sem Content-Length).
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', str(8 * 1024 * 1024)))
+
+# Arquivos estáticos: cache no navegador (os nomes não têm hash, então não é "para sempre")
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.environ.get('STATIC_MAX_AGE', '3600'))
+# Atrás de um nginx/apache com X-Sendfile, o servidor web envia o arquivo em vez do Python
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+# Páginas HTML: cache curto no navegador; depois disso revalida por ETag/Last-Modified (304 sem corpo)
+HTML_MAX_AGE = int(os.environ.get('HTML_MAX_AGE', '60'))
+
 # ========================================
 # CONFIGURAÇÃO DO LOGIN
 # ========================================
@@ -60,14 +130,43 @@ login_manager.init_app(app)
 login_manager.login_view = 'auth.fazer_login'  # Rota para login
 login_manager.login_message = 'Você precisa fazer login para acessar esta página.'
 
+# Colunas do usuário guardadas no cache entre requisições. A senha (hash) fica de fora:
+# quando alguém precisa dela (alterar_senha), ela é carregada do banco na hora, então uma
+# troca de senha feita em outro worker nunca é verificada contra o hash antigo.
+COLUNAS_CACHE_USUARIO = tuple(
+    coluna.key for coluna in inspect(Usuario).column_attrs if coluna.key != 'senha'
+)
+
 # Função que carrega o usuário pela sessão
 @login_manager.user_loader
 def carregar_usuario(id_usuario):
     """
     Função obrigatória do Flask-Login
-    Carrega o usuário pelo ID armazenado na sessão
+    Carrega o usuário pelo ID armazenado na sessão.
+    O Flask-Login já guarda o resultado em `g` durante a requisição; entre requisições
+    as colunas do usuário ficam num cache curto (USER_CACHE_TTL) para evitar um SELECT
+    em toda rota autenticada.
     """
-    return Usuario.query.get(int(id_usuario))
+    try:
+        id_usuario = int(id_usuario)
+    except (TypeError, ValueError):
+        return None
+
+    dados = obter_dados_usuario(id_usuario)
+    if dados is not None:
+        # Reconstrói a instância como "detached" e anexa à sessão sem consultar o banco
+        # (colunas fora do cache, como a senha, são lidas do banco só se forem acessadas)
+        usuario = Usuario(**dados)
+        make_transient_to_detached(usuario)
+        return db.session.merge(usuario, load=False)
+
+    # Session.get consulta primeiro o identity map antes de ir ao banco
+    usuario = db.session.get(Usuario, id_usuario)
+    if usuario is not None:
+        armazenar_dados_usuario(id_usuario, {
+            chave: getattr(usuario, chave) for chave in COLUNAS_CACHE_USUARIO
+        })
+    return usuario
 
 # ========================================
 # REGISTRO DAS ROTAS
@@ -94,21 +193,65 @@ fallback_uri = f"sqlite:///{caminho_banco_fallback}"
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///banco.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Pool de conexões: pre_ping descarta conexões derrubadas pelo servidor antes de usá-las
+opcoes_engine = {'pool_pre_ping': True}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # Conexões compartilhadas entre threads (ex.: gravação de logs) e espera em vez de "database is locked"
+    opcoes_engine['connect_args'] = {'check_same_thread': False, 'timeout': 30}
+else:
+    opcoes_engine['pool_size'] = int(os.environ.get('DB_POOL_SIZE', '10'))
+    opcoes_engine['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+    # Renova conexões antigas antes que o servidor/proxy as derrube por inatividade
+    opcoes_engine['pool_recycle'] = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+    # LIFO: reaproveita as conexões mais recentes e deixa as ociosas expirarem
+    opcoes_engine['pool_use_lifo'] = True
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine
+
 # Inicializa o banco de dados
 db.init_app(app)
 
+# No SQLite (desenvolvimento local), WAL + synchronous=NORMAL evitam um fsync
+# completo a cada commit e deixam leituras concorrentes com as escritas.
+# cache de 64 MB, temporários em memória e mmap de 256 MB reduzem leituras do disco.
+# foreign_keys=ON faz o SQLite validar as chaves estrangeiras como o PostgreSQL.
+@event.listens_for(Engine, 'connect')
+def configurar_sqlite(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.execute('PRAGMA cache_size=-65536')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA mmap_size=268435456')
+        cursor.close()
+
 # Inicializa o Flask-Migrate
 migrate = Migrate(app, db)
 
+# Detector de consultas N+1 (apenas desenvolvimento; pacote opcional)
+if os.environ.get('NPLUSONE_ENABLED', '').lower() in ('1', 'true', 'yes'):
+    try:
+        from nplusone.ext.flask_sqlalchemy import NPlusOne
+        NPlusOne(app)
+        print("nplusone ativo: consultas N+1 serão reportadas no log.")
+    except ImportError:
+        print("nplusone não instalado. Instale com: pip install nplusone")
+
 # --- FUNÇÃO DE CORREÇÃO DO BANCO DE DADOS ---
 def garantir_schema_atualizado():
     """
-    Verifica e cria colunas faltantes (id_usuario, logo, id_empresa) nas tabelas principais 
-    para evitar erros de migração no Render.
+    Verifica e cria colunas faltantes (id_usuario, logo, id_empresa, snapshots) nas tabelas principais 
+    e os índices declarados nos modelos, para evitar erros de migração no Render.
     """
     try:
-        inspector = inspect(db.engine)
-        tabelas_existentes = inspector.get_table_names()
+        # Uma única reflexão traz as colunas de todas as tabelas (no PostgreSQL, uma consulta só),
+        # em vez de um get_columns() por tabela verificada
+        colunas_por_tabela = {
+            tabela: {coluna['name'] for coluna in colunas}
+            for (_, tabela), colunas in inspect(db.engine).get_multi_columns().items()
+        }
+        tabelas_existentes = colunas_por_tabela.keys()
         
         # Lista de tabelas que PRECISAM ter o id_usuario
         tabelas_com_usuario = ['empresas', 'clientes', 'servicos', 'orcamento', 'agendamentos']
@@ -118,8 +261,7 @@ def garantir_schema_atualizado():
             # 1. Adicionar id_usuario em todas as tabelas necessárias
             for tabela in tabelas_com_usuario:
                 if tabela in tabelas_existentes:
-                    colunas = [col['name'] for col in inspector.get_columns(tabela)]
-                    if 'id_usuario' not in colunas:
+                    if 'id_usuario' not in colunas_por_tabela[tabela]:
                         print(f"⚠️ Corrigindo tabela '{tabela}': faltando id_usuario...")
                         # Adiciona a coluna e cria a chave estrangeira
                         conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN id_usuario INTEGER REFERENCES usuario(id_usuario)"))
@@ -128,8 +270,7 @@ def garantir_schema_atualizado():
 
             # 2. Correção específica da tabela 'empresas' (coluna logo)
             if 'empresas' in tabelas_existentes:
-                colunas_empresa = [col['name'] for col in inspector.get_columns('empresas')]
-                if 'logo' not in colunas_empresa:
+                if 'logo' not in colunas_por_tabela['empresas']:
                     print("⚠️ Corrigindo tabela 'empresas': faltando logo...")
                     conn.execute(text("ALTER TABLE empresas ADD COLUMN logo VARCHAR(255)"))
                     conn.commit()
@@ -137,14 +278,36 @@ def garantir_schema_atualizado():
 
             # 3. Correção específica da tabela 'orcamento' (coluna id_empresa) - CORREÇÃO NOVA
             if 'orcamento' in tabelas_existentes:
-                colunas_orcamento = [col['name'] for col in inspector.get_columns('orcamento')]
-                if 'id_empresa' not in colunas_orcamento:
+                if 'id_empresa' not in colunas_por_tabela['orcamento']:
                     print("⚠️ Corrigindo tabela 'orcamento': faltando id_empresa...")
                     # Cria a coluna e já vincula com a tabela empresas (Foreign Key)
                     conn.execute(text("ALTER TABLE orcamento ADD COLUMN id_empresa INTEGER REFERENCES empresas(id_empresa)"))
                     conn.commit()
                     print("✅ Coluna 'id_empresa' adicionada em orcamento!")
 
+            # 4. Colunas de snapshot (nomes gravados no momento do orçamento)
+            colunas_snapshot = {
+                'orcamento': [('cliente_nome_snapshot', 'VARCHAR(80)')],
+                'orcamento_servicos': [
+                    ('servico_nome_snapshot', 'VARCHAR(80)'),
+                    ('servico_descricao_snapshot', 'VARCHAR(255)'),
+                ],
+            }
+            for tabela, colunas_novas in colunas_snapshot.items():
+                if tabela in tabelas_existentes:
+                    for coluna, tipo in colunas_novas:
+                        if coluna not in colunas_por_tabela[tabela]:
+                            print(f"⚠️ Corrigindo tabela '{tabela}': faltando {coluna}...")
+                            conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
+                            conn.commit()
+                            print(f"✅ Coluna '{coluna}' adicionada em {tabela}!")
+
+        # 5. Índices declarados nos modelos que ainda não existem no banco
+        for tabela in db.metadata.sorted_tables:
+            if tabela.name in tabelas_existentes:
+                for indice in tabela.indexes:
+                    indice.create(bind=db.engine, checkfirst=True)
+
     except Exception as e:
         print(f"❌ Erro ao tentar corrigir schema manualmente: {e}")
 
@@ -174,19 +337,99 @@ def api_info():
 # ROTAS PARA SERVIR O FRONTEND (TEMPLATES REORGANIZADOS)
 # ========================================
 
-# Diretórios preferenciais (reorganizados dentro de src/)
-TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
-STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+# Diretórios preferenciais (reorganizados dentro de src/), calculados uma vez na importação
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TELAS_DIR = os.path.normpath(os.path.join(BASE_DIR, '..', 'Telas'))
+TELAS_LOGIN = os.path.join(TELAS_DIR, 'TelaLogin.html')
+AVATAR_DIR = os.path.normpath(os.path.join(BASE_DIR, '..', 'static', 'uploads', 'avatars'))
+
+# Ordem de procura das páginas HTML (a primeira encontrada vence)
+DIRETORIOS_HTML = (
+    TEMPLATES_DIR,
+    os.path.join(TEMPLATES_DIR, 'MenuPrincipal'),
+    TELAS_DIR,
+    os.path.join(TELAS_DIR, 'MenuPrincipal'),
+)
+
+
+# Pastas de arquivos estáticos em ordem de prioridade (src/static primeiro, depois Telas/)
+PASTAS_STATIC = (STATIC_DIR, TELAS_DIR)
+PASTAS_JS = (os.path.join(STATIC_DIR, 'js'), os.path.join(TELAS_DIR, 'js'))
+PASTAS_IMAGENS = (os.path.join(STATIC_DIR, 'Imagens'), os.path.join(TELAS_DIR, 'Imagens'))
+
+
+def _indexar_arquivos(pastas):
+    """
+    Monta {caminho relativo: caminho absoluto} dos arquivos das pastas uma única vez,
+    para não fazer vários os.path.exists() a cada arquivo servido.
+    Em caso de nomes repetidos vale a primeira pasta da lista.
+    """
+    indice = {}
+    for base in pastas:
+        for raiz, _, arquivos in os.walk(base):
+            for arquivo in arquivos:
+                if arquivo.endswith(('.gz', '.br')):
+                    continue  # versões comprimidas geradas: enviadas só via Content-Encoding
+                caminho = os.path.join(raiz, arquivo)
+                relativo = os.path.relpath(caminho, base).replace(os.sep, '/')
+                indice.setdefault(relativo, caminho)
+    return indice
+
+
+# Índices montados na importação: o conjunto de arquivos não muda depois do deploy
+# (um arquivo novo só aparece após reiniciar o servidor; em debug o disco é consultado)
+INDICE_PAGINAS = _indexar_arquivos(DIRETORIOS_HTML)
+INDICE_STATIC = _indexar_arquivos(PASTAS_STATIC)
+INDICE_JS = _indexar_arquivos(PASTAS_JS)
+INDICE_IMAGENS = _indexar_arquivos(PASTAS_IMAGENS)
+
+# Versões .gz/.br dos arquivos de texto, geradas uma vez (ver compressao_utils)
+VERSOES_COMPRIMIDAS = gerar_versoes_comprimidas(
+    list(INDICE_PAGINAS.values()) + list(INDICE_STATIC.values()) + list(INDICE_JS.values())
+)
+
+
+def _enviar_arquivo(indice, pastas, filename, **opcoes):
+    """
+    Envia o arquivo do frontend ou retorna None. send_file é condicional por padrão:
+    com If-None-Match/If-Modified-Since válidos responde 304 sem ler o arquivo.
+    Fora do debug, uma consulta ao índice. Em debug lê direto do disco, tentando abrir
+    em cada pasta (sem um exists() antes de cada tentativa).
+    """
+    if not app.debug:
+        caminho = indice.get(filename)
+        if not caminho:
+            return None
+        if caminho not in VERSOES_COMPRIMIDAS:
+            return send_file(caminho, mimetype=tipo_do_arquivo(caminho), **opcoes)
+        # Envia a versão pré-comprimida aceita pelo navegador, com o tipo do arquivo original
+        enviar, codificacao = escolher_versao(caminho, VERSOES_COMPRIMIDAS, request.accept_encodings)
+        resposta = send_file(enviar, mimetype=tipo_do_arquivo(caminho), **opcoes)
+        if codificacao:
+            resposta.headers['Content-Encoding'] = codificacao
+        resposta.vary.add('Accept-Encoding')
+        return resposta
+    for base in pastas:
+        caminho = safe_join(base, filename)
+        if caminho is None:
+            return None
+        try:
+            return send_file(caminho, mimetype=tipo_do_arquivo(caminho), **opcoes)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            continue
+    return None
 
 
 @app.route('/')
 def index():
     """Serve a página inicial (login) — procura primeiro em src/templates, senão cai para Telas/ antiga."""
-    candidate = os.path.join(TEMPLATES_DIR, 'TelaLogin.html')
-    if os.path.exists(candidate):
-        return send_file(candidate)
+    resposta = _enviar_arquivo(INDICE_PAGINAS, DIRETORIOS_HTML, 'TelaLogin.html', max_age=HTML_MAX_AGE)
+    if resposta is not None:
+        return resposta
     # fallback para estrutura antiga (Telas/)
-    return send_file(os.path.join(os.path.dirname(__file__), '..', 'Telas', 'TelaLogin.html'))
+    return send_file(TELAS_LOGIN, max_age=HTML_MAX_AGE)
 
 
 @app.route('/<path:filename>')
@@ -196,27 +439,34 @@ def serve_html(filename):
     if '.' not in filename:
         filename += '.html'
 
-    # 1) procurar em src/templates
-    file_path = os.path.join(TEMPLATES_DIR, filename)
-    if os.path.exists(file_path):
-        return send_file(file_path)
+    # Páginas HTML com cache curto (HTML_MAX_AGE) e revalidação por ETag/Last-Modified
+    resposta = _enviar_arquivo(INDICE_PAGINAS, DIRETORIOS_HTML, filename, max_age=HTML_MAX_AGE)
+    if resposta is not None:
+        return resposta
 
-    # 2) procurar em src/templates/MenuPrincipal
-    menu_path = os.path.join(TEMPLATES_DIR, 'MenuPrincipal', filename)
-    if os.path.exists(menu_path):
-        return send_file(menu_path)
+    return jsonify({'erro': 'Página não encontrada'}), 404
 
-    # 3) fallback para estrutura antiga (Telas/)
-    telas_path = os.path.join(os.path.dirname(__file__), '..', 'Telas')
-    file_path = os.path.join(telas_path, filename)
-    if os.path.exists(file_path):
-        return send_file(file_path)
 
-    menu_path = os.path.join(telas_path, 'MenuPrincipal', filename)
-    if os.path.exists(menu_path):
-        return send_file(menu_path)
+# Arquivos com hash do conteúdo no nome (ex.: app.3f9a1c2b.js) nunca mudam: cache de 1 ano.
+# Os demais usam SEND_FILE_MAX_AGE_DEFAULT e são revalidados pela ETag (304 sem corpo).
+ARQUIVO_COM_HASH = re.compile(r'\.[0-9a-f]{8,}\.')
+CACHE_IMUTAVEL = 31536000
 
-    return jsonify({'erro': 'Página não encontrada'}), 404
+
+def _marcar_imutavel(resposta):
+    resposta.cache_control.max_age = CACHE_IMUTAVEL
+    resposta.cache_control.public = True
+    resposta.cache_control.immutable = True
+    return resposta
+
+
+def _enviar_estatico(indice, pastas, filename):
+    resposta = _enviar_arquivo(indice, pastas, filename)
+    if resposta is None:
+        abort(404)
+    if ARQUIVO_COM_HASH.search(filename):
+        _marcar_imutavel(resposta)
+    return resposta
 
 
 @app.route('/static/<path:filename>')
@@ -224,76 +474,129 @@ def serve_static(filename):
     """Serve arquivos estáticos (CSS, JS, imagens).
     Procura primeiro em src/static (recomendado), senão cai para Telas/ (estrutura antiga).
     """
-    # 1) src/static
-    if os.path.exists(STATIC_DIR):
-        try:
-            return send_from_directory(STATIC_DIR, filename)
-        except Exception:
-            pass
-
-    # 2) fallback para Telas/
-    static_path = os.path.join(os.path.dirname(__file__), '..', 'Telas')
-    return send_from_directory(static_path, filename)
+    return _enviar_estatico(INDICE_STATIC, PASTAS_STATIC, filename)
 
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve arquivos JavaScript; prioriza src/static/js, depois Telas/js"""
-    # 1) src/static/js
-    js_src = os.path.join(STATIC_DIR, 'js')
-    if os.path.exists(js_src):
-        try:
-            return send_from_directory(js_src, filename)
-        except Exception:
-            pass
-
-    # 2) fallback Telas/js
-    js_path = os.path.join(os.path.dirname(__file__), '..', 'Telas', 'js')
-    return send_from_directory(js_path, filename)
+    return _enviar_estatico(INDICE_JS, PASTAS_JS, filename)
 
 
 @app.route('/Imagens/<path:filename>')
 def serve_images(filename):
     """Serve imagens; prioriza src/static/Imagens, depois Telas/Imagens"""
-    imgs_src = os.path.join(STATIC_DIR, 'Imagens')
-    if os.path.exists(imgs_src):
-        try:
-            return send_from_directory(imgs_src, filename)
-        except Exception:
-            pass
+    return _enviar_estatico(INDICE_IMAGENS, PASTAS_IMAGENS, filename)
+
 
-    images_path = os.path.join(os.path.dirname(__file__), '..', 'Telas', 'Imagens')
-    return send_from_directory(images_path, filename)
+# Avatares pequenos ficam em memória: os mesmos poucos arquivos (um por usuário ativo)
+# são pedidos o tempo todo. Maiores que isso, ou com X-Sendfile, vão direto do disco.
+AVATAR_CACHE_MAXIMO = 512 * 1024
+
+
+@lru_cache(maxsize=128)
+def _ler_avatar(caminho, mtime_ns):
+    """Conteúdo do avatar em cache por (caminho, mtime): um arquivo trocado é lido de novo."""
+    with open(caminho, 'rb') as f:
+        return f.read()
 
 
 @app.route('/avatar/<filename>')
 def avatar_file(filename):
     """Serve arquivos de avatar; procura na pasta padrão de avatares."""
-    # Caminho absoluto para a pasta de avatares
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    avatar_dir = os.path.normpath(os.path.join(base_dir, '..', 'static', 'uploads', 'avatars'))
-    return send_from_directory(avatar_dir, filename)
+    caminho = safe_join(AVATAR_DIR, filename)
+    try:
+        info = os.stat(caminho) if caminho else None
+    except OSError:
+        info = None
+    if info is None or not stat.S_ISREG(info.st_mode):
+        abort(404)
+
+    mimetype = tipo_do_arquivo(filename)
+    if info.st_size > AVATAR_CACHE_MAXIMO or app.config['USE_X_SENDFILE']:
+        resposta = send_file(caminho, mimetype=mimetype)
+    else:
+        resposta = app.response_class(_ler_avatar(caminho, info.st_mtime_ns), mimetype=mimetype)
+        resposta.last_modified = info.st_mtime
+        resposta.set_etag(f'{info.st_mtime_ns:x}-{info.st_size:x}')
+        resposta.make_conditional(request)
+    # Cada upload gera um nome novo (id + data/hora), então o arquivo de um nome nunca muda
+    return _marcar_imutavel(resposta)
+
+# WhiteNoise (opcional, pip install whitenoise): em produção serve /static, /js e /Imagens
+# direto na camada WSGI, antes do roteamento do Flask, usando as versões .br/.gz geradas acima.
+# As rotas acima continuam valendo em debug (MODO_DEBUG), com USE_WHITENOISE=0 e quando
+# o pacote não está instalado.
+# Avatares ficam fora: são enviados em tempo de execução e o WhiteNoise só conhece os arquivos do início.
+try:
+    from whitenoise import WhiteNoise
+    WHITENOISE_AVAILABLE = True
+except ImportError:
+    WHITENOISE_AVAILABLE = False
+
+USE_WHITENOISE = os.environ.get('USE_WHITENOISE', '1').lower() in ('1', 'true', 'yes')
+
+if WHITENOISE_AVAILABLE and USE_WHITENOISE and not MODO_DEBUG:
+    app.wsgi_app = WhiteNoise(
+        app.wsgi_app,
+        max_age=app.config['SEND_FILE_MAX_AGE_DEFAULT'],
+        immutable_file_test=lambda caminho, url: bool(ARQUIVO_COM_HASH.search(url)),
+    )
+    # Em URLs repetidas vale o último add_files: as pastas de maior prioridade entram por último
+    for prefixo, pastas in (('static/', PASTAS_STATIC), ('js/', PASTAS_JS), ('Imagens/', PASTAS_IMAGENS)):
+        for pasta in reversed(pastas):
+            if os.path.isdir(pasta):
+                app.wsgi_app.add_files(pasta, prefix=prefixo)
 
 # ========================================
 # INICIALIZAÇÃO DO SERVIDOR
 # ========================================
 
+def inicializar_banco():
+    """Cria as tabelas que faltam e aplica as correções de schema."""
+    db.create_all()
+    garantir_schema_atualizado() # <--- Roda a correção ampliada
+
+
+@app.cli.command('init-db')
+def init_db():
+    """
+    Cria/atualiza o banco. Rodar uma vez a cada deploy:
+        flask --app src.main init-db
+    """
+    inicializar_banco()
+    print("Banco de dados verificado e atualizado!")
+
+
+@app.cli.command('limpar-tokens')
+def limpar_tokens():
+    """
+    Apaga os tokens de recuperação de senha já usados ou vencidos. Para rodar em cron:
+        flask --app src.main limpar-tokens
+    """
+    resultado = db.session.execute(
+        db.delete(PasswordResetToken).where(PasswordResetToken.inativos(datetime.utcnow()))
+    )
+    db.session.commit()
+    print(f"{resultado.rowcount} token(s) removido(s).")
+
+
 # --- BLOCO FINAL DE INICIALIZAÇÃO ATUALIZADO ---
-if __name__ != '__main__':
-    # Gunicorn (Produção)
+# Gunicorn (Produção): o schema é criado pelo comando init-db no deploy, e não
+# a cada worker iniciado. AUTO_INIT_DB=1 mantém o comportamento antigo.
+if __name__ != '__main__' and os.environ.get('AUTO_INIT_DB', '').lower() in ('1', 'true', 'yes'):
     with app.app_context():
         try:
-            db.create_all()
-            garantir_schema_atualizado() # <--- Roda a correção ampliada
-            print("Banco de dados verificado e atualizado!")
+            inicializar_banco()
         except Exception as e:
             print(f"Erro na inicialização do banco: {e}")
 
 if __name__ == '__main__':
-    # Local (Desenvolvimento)
+    # Local (Desenvolvimento). Em produção use: gunicorn -c gunicorn.conf.py wsgi:application
+    # Reloader e debugger só com FLASK_ENV=development (ou FLASK_DEBUG=1): ver MODO_DEBUG
     print("Acesse pelo link: http://localhost:5000")
     with app.app_context():
-        db.create_all()
-        garantir_schema_atualizado()
+        inicializar_banco()
+        print("Banco de dados verificado e atualizado!")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=MODO_DEBUG)
\ No newline at end of file
@@ -6,12 +6,49 @@
 # Importações necessárias
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from sqlalchemy.dialects.postgresql import to_tsvector
 from datetime import datetime
+import secrets
 
 # Inicializa o banco de dados
 db = SQLAlchemy()
 
+# Hasher de senhas (Argon2id, parâmetros base da OWASP)
+# Bem mais rápido que o PBKDF2 padrão do werkzeug, mantendo resistência por memória
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# Hash gerado uma vez na importação, com os mesmos parâmetros dos hashes reais.
+# Login com email inexistente verifica a senha contra ele: o tempo de resposta
+# não revela se o email está cadastrado.
+_HASH_FICTICIO = password_hasher.hash(secrets.token_urlsafe(16))
+
+
+def verificar_senha_ficticia(senha):
+    """Gasta o mesmo custo de um verificar_senha() real. Sempre retorna False."""
+    try:
+        password_hasher.verify(_HASH_FICTICIO, senha)
+    except (VerificationError, InvalidHashError):
+        pass
+    return False
+
+
+def documento_busca(coluna):
+    """
+    Texto da coluna como tsvector (PostgreSQL) para a busca textual.
+    A mesma expressão é usada nos índices GIN e nas consultas: precisam ser idênticas
+    para o índice ser aproveitado.
+    """
+    # 'simple' escrito literalmente: o DDL do índice não aceita parâmetro
+    return to_tsvector(db.text("'simple'"), db.func.coalesce(coluna, ''))
+
+
+def indice_busca(nome, coluna):
+    """Índice GIN da busca textual; só existe no PostgreSQL (no SQLite a busca usa LIKE)."""
+    return db.Index(nome, documento_busca(coluna), postgresql_using='gin').ddl_if(dialect='postgresql')
+
 # ========================================
 # MODELO: USUÁRIO
 # Representa os usuários do sistema
@@ -30,20 +67,36 @@ class Usuario(UserMixin, db.Model):
     avatar_url = db.Column(db.String(255))                # URL da imagem de perfil
     
     # Relacionamentos (um usuário pode ter vários orçamentos e logs)
-    orcamentos = db.relationship('Orcamento', backref='usuario', lazy=True)
+    # lazy='select' explícito: rotas de listagem usam joinedload/selectinload para evitar N+1
+    orcamentos = db.relationship('Orcamento', back_populates='usuario', lazy='select')
     logs = db.relationship('LogsAcesso', backref='usuario', lazy=True)
+    agendamentos = db.relationship('Agendamento', back_populates='usuario', lazy='select')
     
     # Método obrigatório para o Flask-Login funcionar
     def get_id(self):
         return str(self.id_usuario)
     
-    # Criptografa e salva a senha
+    # Criptografa e salva a senha (Argon2)
     def definir_senha(self, senha):
-        self.senha = generate_password_hash(senha)
+        self.senha = password_hasher.hash(senha)
     
     # Verifica se a senha digitada está correta
     def verificar_senha(self, senha):
-        return check_password_hash(self.senha, senha)
+        if not self.senha:
+            return False
+        # Hashes antigos (pbkdf2/scrypt do werkzeug) continuam válidos até o próximo login
+        if not self.senha.startswith('$argon2'):
+            return check_password_hash(self.senha, senha)
+        try:
+            return password_hasher.verify(self.senha, senha)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    # Indica se o hash salvo deve ser regerado (hash legado ou parâmetros desatualizados)
+    def senha_precisa_rehash(self):
+        if not self.senha or not self.senha.startswith('$argon2'):
+            return True
+        return password_hasher.check_needs_rehash(self.senha)
     
     # Converte o usuário para formato JSON (para APIs)
     def para_dict(self):
@@ -63,6 +116,10 @@ class Usuario(UserMixin, db.Model):
 # ========================================
 class Cliente(db.Model):
     __tablename__ = 'clientes'
+    __table_args__ = (
+        db.Index('ix_cliente_nome', 'nome'),  # busca/ordenação por nome
+        db.Index('ix_cliente_usuario', 'id_usuario'),
+    )
     
     # Campos da tabela
     id_cliente = db.Column(db.Integer, primary_key=True)  # ID único
@@ -74,7 +131,8 @@ class Cliente(db.Model):
     usuario = db.relationship('Usuario', backref=db.backref('clientes', lazy=True))
     
     # Relacionamento (um cliente pode ter vários orçamentos)
-    orcamentos = db.relationship('Orcamento', backref='cliente', lazy=True)
+    # 'dynamic': cliente.orcamentos é uma consulta, nunca carrega a lista inteira sem querer
+    orcamentos = db.relationship('Orcamento', back_populates='cliente', lazy='dynamic')
     
     # Converte o cliente para formato JSON
     def para_dict(self):
@@ -93,6 +151,9 @@ class Cliente(db.Model):
 # ========================================
 class Servico(db.Model):
     __tablename__ = 'servicos'
+    __table_args__ = (
+        db.Index('ix_servico_usuario', 'id_usuario'),
+    )
     
     # Campos da tabela
     id_servicos = db.Column(db.Integer, primary_key=True)  # ID único
@@ -103,7 +164,9 @@ class Servico(db.Model):
     usuario = db.relationship('Usuario', backref=db.backref('servicos', lazy=True))
     
     # Relacionamento (um serviço pode estar em vários orçamentos)
-    orcamento_servicos = db.relationship('OrcamentoServicos', backref='servico', lazy=True)
+    orcamento_servicos = db.relationship('OrcamentoServicos', back_populates='servico', lazy=True)
+    # Coleção: para carregar junto use selectinload (joinedload multiplicaria as linhas)
+    agendamentos = db.relationship('Agendamento', back_populates='servico', lazy='select')
     
     # Converte o serviço para formato JSON
     def para_dict(self):
@@ -112,15 +175,25 @@ class Servico(db.Model):
             'id_usuario': self.id_usuario,
             'nome': self.nome,
             'descricao': self.descricao,
-            'valor': float(self.valor)  # Converte Decimal para float
+            'valor': self.valor  # Decimal -> número na serialização JSON
         }
 
+indice_busca('ix_servico_nome_busca', Servico.nome)
+
 # ========================================
 # MODELO: ORÇAMENTO
 # Representa um orçamento criado
 # ========================================
 class Orcamento(db.Model):
     __tablename__ = 'orcamento'
+    __table_args__ = (
+        db.Index('ix_orc_cliente', 'id_cliente'),
+        db.Index('ix_orc_usuario', 'id_usuario'),
+        # Listagem do usuário ordenada por data (ORDER BY data_criacao DESC sem ordenação em memória)
+        db.Index('ix_orc_usuario_data', 'id_usuario', 'data_criacao'),
+        db.Index('ix_orc_empresa', 'id_empresa'),
+        db.Index('ix_orc_endereco', 'id_endereco'),
+    )
     
     # Campos da tabela
     id_orcamento = db.Column(db.Integer, primary_key=True)  # ID único
@@ -129,15 +202,20 @@ class Orcamento(db.Model):
     id_empresa = db.Column(db.Integer, db.ForeignKey('empresas.id_empresa'), nullable=True)   # Empresa emissora
     # Endereço selecionado no momento do orçamento (opcional)
     id_endereco = db.Column(db.Integer, db.ForeignKey('enderecos.id_endereco'), nullable=True)
-    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)  # Data de criação
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())  # Data de criação
     valor_total = db.Column(db.Numeric(10, 2), nullable=False)      # Valor total do orçamento
     status = db.Column(db.String(15), nullable=False, default='Pendente')  # Status do orçamento
+    # Nome do cliente no momento do orçamento (evita JOIN com clientes nas listagens)
+    cliente_nome_snapshot = db.Column(db.String(80))
     
-    # Relacionamento (um orçamento pode ter vários serviços)
-    orcamento_servicos = db.relationship('OrcamentoServicos', backref='orcamento', lazy=True, cascade='all, delete-orphan')
+    # Relacionamentos usados sempre que o orçamento é serializado (para_dict):
+    # itens via SELECT ... IN (selectin) e cliente/usuário/empresa no mesmo SELECT (joined)
+    orcamento_servicos = db.relationship('OrcamentoServicos', back_populates='orcamento', lazy='selectin', cascade='all, delete-orphan')
+    cliente = db.relationship('Cliente', back_populates='orcamentos', lazy='joined')
+    usuario = db.relationship('Usuario', back_populates='orcamentos', lazy='joined')
+    empresa = db.relationship('Empresa', back_populates='orcamentos', lazy='joined')
     # Relacionamento com Endereco
     endereco = db.relationship('Endereco', backref='orcamentos', lazy=True)
-    empresa = db.relationship('Empresa', backref='orcamentos', lazy=True)
     
     def numero_usuario(self):
         if not self.id_usuario:
@@ -149,6 +227,14 @@ class Orcamento(db.Model):
                 )
                 ).count()
     
+    # Nome do cliente a exibir (JSON, PDF, email): o snapshot da época do orçamento.
+    # Orçamentos antigos (sem snapshot) continuam lendo do cliente
+    @property
+    def cliente_nome(self):
+        if self.cliente_nome_snapshot is not None:
+            return self.cliente_nome_snapshot
+        return self.cliente.nome if self.cliente else None
+    
     # Converte o orçamento para formato JSON
     def para_dict(self):
         return {
@@ -156,10 +242,10 @@ class Orcamento(db.Model):
             'id_cliente': self.id_cliente,
             'id_usuario': self.id_usuario,
             'id_empresa': self.id_empresa,
-            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
-            'valor_total': float(self.valor_total),
+            'data_criacao': self.data_criacao,
+            'valor_total': self.valor_total,
             'status': self.status,
-            'cliente_nome': self.cliente.nome if self.cliente else None,
+            'cliente_nome': self.cliente_nome,
             'cliente_telefone': self.cliente.telefone if self.cliente else None,
             'cliente_email': self.cliente.email if self.cliente else None,
             'cliente_endereco': self.cliente.endereco if self.cliente else None,
@@ -175,6 +261,9 @@ class Orcamento(db.Model):
 # ========================================
 class OrcamentoServicos(db.Model):
     __tablename__ = 'orcamento_servicos'
+    __table_args__ = (
+        db.Index('ix_os_servico', 'id_servico'),  # junção reversa servico -> orcamento_servicos
+    )
     
     # Chaves primárias compostas
     id_orcamento = db.Column(db.Integer, db.ForeignKey('orcamento.id_orcamento'), primary_key=True)
@@ -184,6 +273,27 @@ class OrcamentoServicos(db.Model):
     quantidade = db.Column(db.Integer, default=1)                    # Quantidade do serviço
     valor_unitario = db.Column(db.Numeric(10, 2), nullable=False)    # Preço na época do orçamento
     subtotal = db.Column(db.Numeric(10, 2), nullable=False)          # Quantidade × Valor unitário
+    # Nome/descrição do serviço na época do orçamento (como o valor_unitario)
+    servico_nome_snapshot = db.Column(db.String(80))
+    servico_descricao_snapshot = db.Column(db.String(255))
+    
+    # Relacionamentos
+    orcamento = db.relationship('Orcamento', back_populates='orcamento_servicos')
+    servico = db.relationship('Servico', back_populates='orcamento_servicos', lazy='joined')
+    
+    # Nome/descrição a exibir (JSON, PDF, email, logs): o snapshot da época do orçamento.
+    # Itens antigos (sem snapshot) continuam lendo do serviço
+    @property
+    def servico_nome(self):
+        if self.servico_nome_snapshot is not None:
+            return self.servico_nome_snapshot
+        return self.servico.nome if self.servico else None
+    
+    @property
+    def servico_descricao(self):
+        if self.servico_nome_snapshot is not None:
+            return self.servico_descricao_snapshot
+        return self.servico.descricao if self.servico else None
     
     # Converte para formato JSON
     def para_dict(self):
@@ -191,10 +301,10 @@ class OrcamentoServicos(db.Model):
             'id_orcamento': self.id_orcamento,
             'id_servico': self.id_servico,
             'quantidade': self.quantidade,
-            'valor_unitario': float(self.valor_unitario),
-            'subtotal': float(self.subtotal),
-            'servico_nome': self.servico.nome if self.servico else None,
-            'servico_descricao': self.servico.descricao if self.servico else None
+            'valor_unitario': self.valor_unitario,
+            'subtotal': self.subtotal,
+            'servico_nome': self.servico_nome,
+            'servico_descricao': self.servico_descricao
         }
 
 # ========================================
@@ -203,12 +313,17 @@ class OrcamentoServicos(db.Model):
 # ========================================
 class LogsAcesso(db.Model):
     __tablename__ = 'logs_acesso'
+    __table_args__ = (
+        db.Index('ix_logs_user_time', 'id_usuario', 'data_hora'),
+    )
     
     # Campos da tabela
     id_log = db.Column(db.Integer, primary_key=True)       # ID único
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id_usuario'), nullable=False)  # Usuário
     acao = db.Column(db.String(100), nullable=False)       # Descrição da ação
-    data_hora = db.Column(db.DateTime, default=datetime.utcnow)  # Quando aconteceu
+    # Quando aconteceu: preenchido pelo banco (server_default). O default Python continua
+    # para bancos antigos, criados sem DEFAULT na coluna (o SQLite não permite alterá-lo).
+    data_hora = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())
     
     # Converte para formato JSON
     def para_dict(self):
@@ -216,7 +331,7 @@ class LogsAcesso(db.Model):
             'id_log': self.id_log,
             'id_usuario': self.id_usuario,
             'acao': self.acao,
-            'data_hora': self.data_hora.isoformat() if self.data_hora else None,
+            'data_hora': self.data_hora,
             'usuario_nome': self.usuario.nome if self.usuario else None
         }
 
@@ -225,6 +340,9 @@ class LogsAcesso(db.Model):
 # ========================================
 class Endereco(db.Model):
     __tablename__ = 'enderecos'
+    __table_args__ = (
+        db.Index('ix_endereco_cliente', 'id_cliente'),
+    )
 
     id_endereco = db.Column(db.Integer, primary_key=True)
     id_cliente = db.Column(db.Integer, db.ForeignKey('clientes.id_cliente'), nullable=False)
@@ -265,6 +383,9 @@ Cliente.enderecos = db.relationship('Endereco', backref='cliente', lazy=True, ca
 # ========================================
 class Empresa(db.Model):
     __tablename__ = 'empresas'
+    __table_args__ = (
+        db.Index('ix_empresa_usuario', 'id_usuario'),
+    )
     id_empresa = db.Column(db.Integer, primary_key=True)
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id_usuario'), nullable=False)
     nome = db.Column(db.String(80), nullable=False)
@@ -274,6 +395,7 @@ class Empresa(db.Model):
     email = db.Column(db.String(50))
     logo = db.Column(db.String(255))  # Caminho do arquivo da logo
     usuario = db.relationship('Usuario', backref=db.backref('empresas', lazy=True))
+    orcamentos = db.relationship('Orcamento', back_populates='empresa', lazy=True)
 
     def para_dict(self):
         return {
@@ -289,12 +411,16 @@ class Empresa(db.Model):
 # ========================================
 class Venda(db.Model):
     __tablename__ = 'vendas'
+    __table_args__ = (
+        db.Index('ix_venda_cliente', 'id_cliente'),
+        db.Index('ix_venda_usuario', 'id_usuario'),
+    )
 
     id_venda = db.Column(db.Integer, primary_key=True)
     id_orcamento = db.Column(db.Integer, db.ForeignKey('orcamento.id_orcamento'), unique=True, nullable=False)
     id_cliente = db.Column(db.Integer, db.ForeignKey('clientes.id_cliente'), nullable=False)
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id_usuario'), nullable=False)
-    data_venda = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    data_venda = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp(), nullable=False)
     codigo_venda = db.Column(db.String(40), unique=True, nullable=False)
     valor_total = db.Column(db.Numeric(10, 2), nullable=False)
 
@@ -306,14 +432,18 @@ class Venda(db.Model):
             'id_orcamento': self.id_orcamento,
             'id_cliente': self.id_cliente,
             'id_usuario': self.id_usuario,
-            'data_venda': self.data_venda.isoformat() if self.data_venda else None,
+            'data_venda': self.data_venda,
             'codigo_venda': self.codigo_venda,
-            'valor_total': float(self.valor_total),
+            'valor_total': self.valor_total,
         }
 
 
 class VendaItem(db.Model):
     __tablename__ = 'venda_itens'
+    __table_args__ = (
+        db.Index('ix_venda_item_venda', 'id_venda'),
+        db.Index('ix_venda_item_servico', 'id_servico'),
+    )
 
     id_item = db.Column(db.Integer, primary_key=True)
     id_venda = db.Column(db.Integer, db.ForeignKey('vendas.id_venda'), nullable=False)
@@ -328,8 +458,8 @@ class VendaItem(db.Model):
             'id_venda': self.id_venda,
             'id_servico': self.id_servico,
             'quantidade': self.quantidade,
-            'valor_unitario': float(self.valor_unitario),
-            'subtotal': float(self.subtotal),
+            'valor_unitario': self.valor_unitario,
+            'subtotal': self.subtotal,
         }
 
 
@@ -339,21 +469,30 @@ class VendaItem(db.Model):
 # ========================================
 class Agendamento(db.Model):
     __tablename__ = 'agendamentos'
+    __table_args__ = (
+        # Listagem do usuário ordenada por data_hora, com ou sem filtro de status,
+        # lida na ordem do índice (sem etapa de ordenação)
+        db.Index('ix_agend_user_data', 'id_usuario', 'data_hora'),
+        db.Index('ix_agend_user_status', 'id_usuario', 'status', 'data_hora'),
+        db.Index('ix_agend_servico', 'id_servico'),
+    )
     
     # Campos da tabela
     id_agendamento = db.Column(db.Integer, primary_key=True)  # ID único
     id_servico = db.Column(db.Integer, db.ForeignKey('servicos.id_servicos'), nullable=False)  # Serviço agendado
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id_usuario'), nullable=False)   # Usuário que criou
     data_hora = db.Column(db.DateTime, nullable=False)        # Data e hora do agendamento
-    valor = db.Column(db.Numeric(10, 2), nullable=False)      # Valor do serviço na época do agendamento
+    # asdecimal=False: lido já como float (só é exibido, nunca somado), sem conversão no JSON
+    valor = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)  # Valor do serviço na época do agendamento
     status = db.Column(db.String(20), default='Agendado')     # Status: Agendado, Concluído, Cancelado
     observacoes = db.Column(db.Text)                          # Observações adicionais
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Data de criação
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Data de atualização
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())  # Data de criação
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.current_timestamp())  # Data de atualização
     
     # Relacionamentos
-    servico = db.relationship('Servico', backref='agendamentos', lazy=True)
-    usuario = db.relationship('Usuario', backref='agendamentos', lazy=True)
+    # Lados "um" lidos sempre por para_dict: vêm no mesmo SELECT do agendamento (joined)
+    servico = db.relationship('Servico', back_populates='agendamentos', lazy='joined')
+    usuario = db.relationship('Usuario', back_populates='agendamentos', lazy='joined')
     
     # Converte o agendamento para formato JSON
     def para_dict(self):
@@ -361,35 +500,45 @@ class Agendamento(db.Model):
             'id_agendamento': self.id_agendamento,
             'id_servico': self.id_servico,
             'id_usuario': self.id_usuario,
-            'data_hora': self.data_hora.isoformat() if self.data_hora else None,
-            'valor': float(self.valor),
+            'data_hora': self.data_hora,
+            'valor': self.valor,
             'status': self.status,
             'observacoes': self.observacoes,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
             'servico_nome': self.servico.nome if self.servico else None,
             'servico_descricao': self.servico.descricao if self.servico else None,
             'usuario_nome': self.usuario.nome if self.usuario else None
         }
 
+indice_busca('ix_agend_obs_busca', Agendamento.observacoes)
+
 # ========================================
 # MODELO: TOKEN DE RECUPERAÇÃO DE SENHA
 # ========================================
 class PasswordResetToken(db.Model):
     __tablename__ = 'password_reset_tokens'
+    __table_args__ = (
+        db.Index('ix_reset_usuario', 'id_usuario'),
+    )
 
     id_token = db.Column(db.Integer, primary_key=True)
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id_usuario'), nullable=False)
-    token = db.Column(db.String(128), unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    token = db.Column(db.String(128), unique=True, nullable=False)  # HMAC-SHA256 (hex) do token enviado por email
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp(), nullable=False)
     expires_at = db.Column(db.DateTime, nullable=False)
     used_at = db.Column(db.DateTime, nullable=True)
 
+    @classmethod
+    def inativos(cls, agora):
+        """Condição dos tokens que não servem mais (já usados ou vencidos), para a limpeza."""
+        return db.or_(cls.used_at.isnot(None), cls.expires_at < agora)
+
     def para_dict(self):
         return {
             'id_token': self.id_token,
             'id_usuario': self.id_usuario,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
-            'used_at': self.used_at.isoformat() if self.used_at else None,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+            'used_at': self.used_at,
         }
\ No newline at end of file
@@ -2,36 +2,107 @@
 # ROTAS DE AGENDAMENTOS
 # ========================================
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_required, current_user
-from src.models.models import db, Agendamento, Servico, LogsAcesso
+from sqlalchemy.orm import joinedload, raiseload
+from src.models.models import db, Agendamento, Servico, Usuario
+from src.utils.consulta_utils import filtro_busca_textual, obter_do_usuario
+from src.utils.json_utils import responder_lista_json
+from src.utils.log_utils import registrar_log_no_commit
+from src.utils.paginacao_utils import ler_parametros_paginacao, paginar_consulta
+from src.utils.validacao_utils import ler_data_hora
 from datetime import datetime
 
 agendamentos_bp = Blueprint('agendamentos', __name__)
 
+# Status aceitos por rota (PUT /<id>/status aceita só os básicos) e as mensagens de erro, montados uma vez
+STATUS_ALTERACAO = ('Agendado', 'Concluído', 'Cancelado')
+STATUS_EDICAO = ('Agendado', 'Confirmado', 'Em Andamento', 'Concluído', 'Cancelado')
+STATUS_ALTERACAO_VALIDOS = frozenset(STATUS_ALTERACAO)
+STATUS_EDICAO_VALIDOS = frozenset(STATUS_EDICAO)
+ERRO_STATUS_ALTERACAO = f'Status inválido. Use: {", ".join(STATUS_ALTERACAO)}'
+ERRO_STATUS_EDICAO = f'Status inválido. Use: {", ".join(STATUS_EDICAO)}'
+
+# Campos do PUT anexados às observações como "[Rótulo: valor]"
+CAMPOS_ANEXADOS_OBSERVACOES = (('endereco', 'Endereço'), ('tecnico', 'Técnico'))
+
+# Linhas lidas do banco (e serializadas) por vez na listagem completa
+LOTE_LISTAGEM = 200
+
+
+def _opcoes_carregamento_agendamento(bloquear_lazy_load=False):
+    """Opções de eager loading usadas por para_dict (serviço e usuário no mesmo SELECT).
+
+    bloquear_lazy_load: em debug, qualquer outro relacionamento acessado levanta erro
+    (raiseload), revelando um N+1 novo. Usar só em rotas que não fazem commit depois.
+    """
+    opcoes = [
+        joinedload(Agendamento.servico),
+        joinedload(Agendamento.usuario),
+    ]
+    if bloquear_lazy_load and current_app.debug:
+        opcoes.append(raiseload('*'))
+    return tuple(opcoes)
+
+
+def _consulta_lista_agendamentos(id_usuario):
+    """
+    SELECT só das colunas que a listagem devolve, com as mesmas chaves de Agendamento.para_dict().
+    Sem montar objetos ORM: serviço e usuário vêm por JOIN na mesma consulta.
+    """
+    return (
+        db.select(
+            Agendamento.id_agendamento,
+            Agendamento.id_servico,
+            Agendamento.id_usuario,
+            Agendamento.data_hora,
+            Agendamento.valor,
+            Agendamento.status,
+            Agendamento.observacoes,
+            Agendamento.created_at,
+            Agendamento.updated_at,
+            Servico.nome.label('servico_nome'),
+            Servico.descricao.label('servico_descricao'),
+            Usuario.nome.label('usuario_nome'),
+        )
+        .outerjoin(Servico, Servico.id_servicos == Agendamento.id_servico)
+        .outerjoin(Usuario, Usuario.id_usuario == Agendamento.id_usuario)
+        .where(Agendamento.id_usuario == id_usuario)
+        # id como desempate: ordem estável entre as páginas
+        .order_by(Agendamento.data_hora.asc(), Agendamento.id_agendamento.asc())
+    )
+
+
 @agendamentos_bp.route('/', methods=['GET'])
 @login_required
 def listar_agendamentos():
+    """
+    Lista os agendamentos do usuário (filtros opcionais: status e busca).
+    Parâmetros opcionais: page e per_page (paginação). Sem eles, retorna a lista completa.
+    """
     try:
         status_filtro = request.args.get('status')
         busca = request.args.get('busca', '').strip().lower()
-        query = Agendamento.query.filter_by(id_usuario=current_user.id_usuario)
+        consulta = _consulta_lista_agendamentos(current_user.id_usuario)
+        page, per_page, _ = ler_parametros_paginacao()
         
         if status_filtro:
-            query = query.filter_by(status=status_filtro)
+            consulta = consulta.where(Agendamento.status == status_filtro)
         if busca:
-            query = query.join(Servico).filter(
-                db.or_(
-                    Servico.nome.ilike(f'%{busca}%'),
-                    Agendamento.observacoes.ilike(f'%{busca}%')
-                )
-            )
-        agendamentos = query.order_by(Agendamento.data_hora.asc()).all()
-        agendamentos_json = [ag.para_dict() for ag in agendamentos]
-        
+            consulta = consulta.where(filtro_busca_textual((Servico.nome, Agendamento.observacoes), busca))
+
+        if page is None:
+            # Lista completa enviada em partes, lendo as linhas do banco em lotes
+            resultado = db.session.execute(consulta.execution_options(yield_per=LOTE_LISTAGEM))
+            # O cursor e a conexão ficam em uso até o fim do download (ver responder_lista_json)
+            return responder_lista_json('agendamentos', (linha._asdict() for linha in resultado), LOTE_LISTAGEM)
+
+        linhas, total = paginar_consulta(consulta, page, per_page)
         return jsonify({
-            'agendamentos': agendamentos_json,
-            'total': len(agendamentos_json)
+            'agendamentos': [linha._asdict() for linha in linhas],
+            'total': total,
+            'page': page,
+            'per_page': per_page
         }), 200
     except Exception as e:
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
@@ -54,13 +125,13 @@ def criar_agendamento():
         if not data_hora_str:
             return jsonify({'erro': 'Data e hora são obrigatórias'}), 400
         
-        servico = Servico.query.get(id_servico)
+        servico = obter_do_usuario(Servico, id_servico)
         if not servico:
             return jsonify({'erro': 'Serviço não encontrado'}), 404
         
         try:
-            data_hora = datetime.fromisoformat(data_hora_str.replace('Z', '+00:00'))
-        except ValueError:
+            data_hora = ler_data_hora(data_hora_str)
+        except (TypeError, ValueError):
             return jsonify({'erro': 'Formato de data/hora inválido'}), 400
         
         if data_hora < datetime.utcnow():
@@ -76,14 +147,7 @@ def criar_agendamento():
         )
         
         db.session.add(novo_agendamento)
-        db.session.commit()
-        
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Agendamento criado: {servico.nome} para {data_hora.strftime("%d/%m/%Y %H:%M")}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Agendamento criado: {servico.nome} para {data_hora.strftime("%d/%m/%Y %H:%M")}')
         db.session.commit()
         
         return jsonify({
@@ -107,30 +171,18 @@ def atualizar_status_agendamento(id_agendamento):
         if not novo_status:
             return jsonify({'erro': 'Status é obrigatório'}), 400
         
-        status_validos = ['Agendado', 'Concluído', 'Cancelado']
-        if novo_status not in status_validos:
-            return jsonify({'erro': f'Status inválido. Use: {", ".join(status_validos)}'}), 400
+        if novo_status not in STATUS_ALTERACAO_VALIDOS:
+            return jsonify({'erro': ERRO_STATUS_ALTERACAO}), 400
         
-        agendamento = Agendamento.query.filter_by(
-            id_agendamento=id_agendamento,
-            id_usuario=current_user.id_usuario
-        ).first()
+        agendamento = obter_do_usuario(Agendamento, id_agendamento, _opcoes_carregamento_agendamento())
         
         if not agendamento:
             return jsonify({'erro': 'Agendamento não encontrado'}), 404
         
         status_anterior = agendamento.status
         agendamento.status = novo_status
-        agendamento.updated_at = datetime.utcnow()
         
-        db.session.commit()
-        
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Status do agendamento alterado: {status_anterior} → {novo_status}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Status do agendamento alterado: {status_anterior} → {novo_status}')
         db.session.commit()
         
         return jsonify({
@@ -146,10 +198,8 @@ def atualizar_status_agendamento(id_agendamento):
 @login_required
 def obter_agendamento(id_agendamento):
     try:
-        agendamento = Agendamento.query.filter_by(
-            id_agendamento=id_agendamento,
-            id_usuario=current_user.id_usuario
-        ).first()
+        agendamento = obter_do_usuario(
+            Agendamento, id_agendamento, _opcoes_carregamento_agendamento(bloquear_lazy_load=True))
         
         if not agendamento:
             return jsonify({'erro': 'Agendamento não encontrado'}), 404
@@ -169,49 +219,38 @@ def atualizar_agendamento(id_agendamento):
         if not dados:
             return jsonify({'erro': 'Nenhum dado foi enviado'}), 400
         
-        agendamento = Agendamento.query.filter_by(
-            id_agendamento=id_agendamento,
-            id_usuario=current_user.id_usuario
-        ).first()
+        agendamento = obter_do_usuario(Agendamento, id_agendamento, _opcoes_carregamento_agendamento())
         
         if not agendamento:
             return jsonify({'erro': 'Agendamento não encontrado'}), 404
         
         if 'data_hora' in dados and dados['data_hora']:
             try:
-                data_hora = datetime.fromisoformat(dados['data_hora'].replace('Z', '+00:00'))
-                agendamento.data_hora = data_hora
-            except ValueError:
+                agendamento.data_hora = ler_data_hora(dados['data_hora'])
+            except (TypeError, ValueError):
                 return jsonify({'erro': 'Formato de data/hora inválido'}), 400
         
         if 'status' in dados:
-            status_validos = ['Agendado', 'Confirmado', 'Em Andamento', 'Concluído', 'Cancelado']
-            if dados['status'] not in status_validos:
-                return jsonify({'erro': f'Status inválido. Use: {", ".join(status_validos)}'}), 400
+            if dados['status'] not in STATUS_EDICAO_VALIDOS:
+                return jsonify({'erro': ERRO_STATUS_EDICAO}), 400
             agendamento.status = dados['status']
         
         if 'observacoes' in dados:
             agendamento.observacoes = dados.get('observacoes', '')
         
-        if 'endereco' in dados:
-            endereco_info = f"\n[Endereço: {dados['endereco']}]" if dados['endereco'] else ""
-            if endereco_info and endereco_info not in (agendamento.observacoes or ''):
-                agendamento.observacoes = (agendamento.observacoes or '') + endereco_info
-        
-        if 'tecnico' in dados:
-            tecnico_info = f"\n[Técnico: {dados['tecnico']}]" if dados['tecnico'] else ""
-            if tecnico_info and tecnico_info not in (agendamento.observacoes or ''):
-                agendamento.observacoes = (agendamento.observacoes or '') + tecnico_info
-        
-        agendamento.updated_at = datetime.utcnow()
-        db.session.commit()
-        
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Agendamento atualizado: {agendamento.servico.nome if agendamento.servico else "N/A"}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        # Endereço/técnico viram linhas "[Rótulo: valor]" no fim das observações (uma vez cada)
+        observacoes = agendamento.observacoes or ''
+        linhas_existentes = set(observacoes.splitlines())
+        extras = []
+        for campo, rotulo in CAMPOS_ANEXADOS_OBSERVACOES:
+            if dados.get(campo):
+                linha = f'[{rotulo}: {dados[campo]}]'
+                if linha not in linhas_existentes:
+                    extras.append(linha)
+        if extras:
+            agendamento.observacoes = observacoes + '\n' + '\n'.join(extras)
+        
+        registrar_log_no_commit(current_user.id_usuario, f'Agendamento atualizado: {agendamento.servico.nome if agendamento.servico else "N/A"}')
         db.session.commit()
         
         return jsonify({
@@ -227,20 +266,12 @@ def atualizar_agendamento(id_agendamento):
 @login_required
 def excluir_agendamento(id_agendamento):
     try:
-        agendamento = Agendamento.query.filter_by(
-            id_agendamento=id_agendamento,
-            id_usuario=current_user.id_usuario
-        ).first()
+        agendamento = obter_do_usuario(Agendamento, id_agendamento, (joinedload(Agendamento.servico),))
         
         if not agendamento:
             return jsonify({'erro': 'Agendamento não encontrado'}), 404
         
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Agendamento excluído: {agendamento.servico.nome if agendamento.servico else "N/A"}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Agendamento excluído: {agendamento.servico.nome if agendamento.servico else "N/A"}')
         
         db.session.delete(agendamento)
         db.session.commit()
@@ -4,17 +4,105 @@
 # ========================================
 
 # Importações necessárias
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from src.models.models import db, Usuario, LogsAcesso, PasswordResetToken
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
+from src.models.models import db, Usuario, PasswordResetToken, verificar_senha_ficticia
 from datetime import datetime, timedelta
+import hashlib
+import hmac
 import secrets
 import os
-from src.utils.email_utils import send_email, get_smtp_config
+import tempfile
+from src.utils.email_utils import agendar_envio, send_email, get_smtp_config
+from src.utils.limite_utils import contar_tentativas, limpar_tentativas, registrar_tentativa
+from src.utils.usuario_cache import invalidar_usuario
+from src.utils.log_utils import registrar_log, registrar_log_na_transacao, registrar_log_no_commit
+from src.utils.validacao_utils import LIMITES_USUARIO, montar_erros_tamanho, validar_tamanhos
 
 # Cria um blueprint (grupo de rotas) para autenticação
 auth_bp = Blueprint('auth', __name__)
 
+# Respostas de erro de tamanho já serializadas (uma por campo)
+ERROS_TAMANHO_USUARIO = montar_erros_tamanho(LIMITES_USUARIO)
+
+# Upload de avatar: pasta criada uma vez na importação (a mesma servida por /avatar/ no main)
+AVATAR_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'static', 'uploads', 'avatars'))
+os.makedirs(AVATAR_DIR, exist_ok=True)
+AVATAR_EXTENSOES = frozenset({'png', 'jpg', 'jpeg', 'gif', 'webp'})
+AVATAR_TAMANHO_MAXIMO = int(os.environ.get('AVATAR_MAX_BYTES', str(2 * 1024 * 1024)))
+_FOLGA_FORMULARIO = 64 * 1024  # campos de texto e cabeçalhos multipart além do arquivo
+
+
+_BLOCO_AVATAR = 64 * 1024
+
+
+def _salvar_avatar(arquivo, nome_arquivo):
+    """
+    Copia o upload em blocos para um temporário na própria pasta e renomeia (os.replace é atômico):
+    /avatar/ nunca vê um arquivo pela metade. Para de ler assim que passar de AVATAR_TAMANHO_MAXIMO
+    (vale também sem Content-Length, em uploads chunked) e retorna False nesse caso.
+    """
+    tmp = tempfile.NamedTemporaryFile(dir=AVATAR_DIR, prefix='.upload_', delete=False)
+    try:
+        with tmp:
+            tamanho = 0
+            while True:
+                bloco = arquivo.stream.read(_BLOCO_AVATAR)
+                if not bloco:
+                    break
+                tamanho += len(bloco)
+                if tamanho > AVATAR_TAMANHO_MAXIMO:
+                    break
+                tmp.write(bloco)
+        if tamanho > AVATAR_TAMANHO_MAXIMO:
+            os.unlink(tmp.name)
+            return False
+        os.replace(tmp.name, os.path.join(AVATAR_DIR, nome_arquivo))
+        return True
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+        raise
+
+
+def _remover_avatar(nome_arquivo):
+    """Apaga um avatar recém-salvo cuja alteração de perfil não foi confirmada no banco."""
+    if nome_arquivo:
+        try:
+            os.unlink(os.path.join(AVATAR_DIR, nome_arquivo))
+        except FileNotFoundError:
+            pass
+
+# Limites contra força bruta, verificados antes de qualquer hash de senha ou consulta
+JANELA_TENTATIVAS = 900            # segundos (15 minutos)
+LIMITE_FALHAS_LOGIN_IP = 20        # senhas erradas por IP na janela
+LIMITE_FALHAS_LOGIN_EMAIL = 5      # senhas erradas por conta na janela
+LIMITE_PEDIDOS_RECUPERACAO = 5     # forgot-password por IP e por email
+LIMITE_FALHAS_RESET_IP = 10        # tokens inválidos em reset-password por IP
+
+
+def _chave_email(prefixo, email):
+    """Chave do contador por email (hash: o endereço não fica exposto no Redis)."""
+    return f"{prefixo}:email:{hashlib.sha256(str(email).strip().lower().encode('utf-8')).hexdigest()[:16]}"
+
+
+def _hash_token(token):
+    """
+    Hash com chave (HMAC-SHA256 sobre a SECRET_KEY) do token de recuperação.
+    Só o hash vai para o banco: um backup vazado não permite redefinir senhas.
+    """
+    chave = str(current_app.secret_key).encode('utf-8')
+    return hmac.new(chave, token.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _resposta_limite_excedido():
+    resposta = jsonify({'erro': 'Muitas tentativas. Tente novamente em alguns minutos.'})
+    resposta.status_code = 429
+    resposta.headers['Retry-After'] = str(JANELA_TENTATIVAS)
+    return resposta
+
 # ========================================
 # ROTA: CADASTRAR USUÁRIO
 # POST /api/auth/register
@@ -44,20 +132,15 @@ def cadastrar_usuario():
         if not nome or not email or not senha:
             return jsonify({'erro': 'Nome, email e senha são obrigatórios'}), 400
         
-        if len(nome) > 80:
-            return jsonify({'erro': 'Nome muito longo (máximo 80 caracteres)'}), 400
-        
-        if len(email) > 50:
-            return jsonify({'erro': 'Email muito longo (máximo 50 caracteres)'}), 400
+        erro_tamanho = validar_tamanhos(dados, LIMITES_USUARIO, ERROS_TAMANHO_USUARIO)
+        if erro_tamanho:
+            return erro_tamanho
         
         if len(senha) < 6:
             return jsonify({'erro': 'Senha deve ter pelo menos 6 caracteres'}), 400
         
-        # Verifica se o email já está sendo usado
-        usuario_existente = Usuario.query.filter_by(email=email).first()
-        if usuario_existente:
-            return jsonify({'erro': 'Este email já está cadastrado'}), 400
-        
+        # Email repetido é barrado pela restrição UNIQUE no INSERT (IntegrityError abaixo):
+        # sem SELECT prévio e sem janela para dois cadastros simultâneos com o mesmo email
         # Cria um novo usuário
         novo_usuario = Usuario(
             nome=nome,
@@ -69,15 +152,10 @@ def cadastrar_usuario():
         
         # Salva no banco de dados
         db.session.add(novo_usuario)
-        db.session.commit()
+        db.session.flush()  # gera o id_usuario (o INSERT sairia no commit de qualquer forma)
         
-        # Registra a ação no log
-        log = LogsAcesso(
-            id_usuario=novo_usuario.id_usuario,
-            acao='Usuário cadastrado no sistema',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        # Log gravado junto com a confirmação do cadastro (descartado se houver rollback)
+        registrar_log_no_commit(novo_usuario.id_usuario, 'Usuário cadastrado no sistema')
         db.session.commit()
         
         # Retorna sucesso
@@ -86,6 +164,9 @@ def cadastrar_usuario():
             'usuario': novo_usuario.para_dict()
         }), 201
         
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'erro': 'Este email já está cadastrado'}), 400
     except Exception as e:
         # Se deu erro, desfaz as alterações no banco
         db.session.rollback()
@@ -116,24 +197,37 @@ def fazer_login():
         if not email or not senha:
             return jsonify({'erro': 'Email e senha são obrigatórios'}), 400
         
+        # Muitas falhas recentes do IP ou da conta: recusa sem consultar o banco nem calcular hash
+        chave_ip = f'rl:login:ip:{request.remote_addr}'
+        chave_email = _chave_email('rl:login', email)
+        if (contar_tentativas(chave_ip) >= LIMITE_FALHAS_LOGIN_IP
+                or contar_tentativas(chave_email) >= LIMITE_FALHAS_LOGIN_EMAIL):
+            return _resposta_limite_excedido()
+        
         # Busca o usuário pelo email
         usuario = Usuario.query.filter_by(email=email).first()
         
         # Verifica se o usuário existe e se a senha está correta
+        # (email inexistente também paga o custo do hash: mesmo tempo de resposta)
+        if usuario is None:
+            verificar_senha_ficticia(senha)
         if not usuario or not usuario.verificar_senha(senha):
+            registrar_tentativa(chave_ip, JANELA_TENTATIVAS)
+            registrar_tentativa(chave_email, JANELA_TENTATIVAS)
             return jsonify({'erro': 'Email ou senha incorretos'}), 401
+        limpar_tentativas(chave_email)
+        
+        # Atualiza o hash de forma transparente (legado werkzeug -> Argon2)
+        if usuario.senha_precisa_rehash():
+            usuario.definir_senha(senha)
+            db.session.commit()
         
         # Faz o login (cria a sessão)
         login_user(usuario)
         
         # Registra o login no log
-        log = LogsAcesso(
-            id_usuario=usuario.id_usuario,
-            acao='Login realizado',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(usuario.id_usuario, 'Login realizado')
+        invalidar_usuario(usuario.id_usuario)  # descarta dados antigos (ex.: hash regerado)
         
         # Retorna sucesso
         return jsonify({
@@ -157,13 +251,7 @@ def fazer_logout():
     """
     try:
         # Registra o logout no log antes de sair
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao='Logout realizado',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, 'Logout realizado')
         
         # Faz o logout (encerra a sessão)
         logout_user()
@@ -208,32 +296,34 @@ def forgot_password():
     try:
         dados = request.get_json() or {}
         email = (dados.get('email') or '').strip()
+        # Cada pedido gera token e email: limitado por IP e por endereço
+        if (registrar_tentativa(f'rl:recuperacao:ip:{request.remote_addr}', JANELA_TENTATIVAS) > LIMITE_PEDIDOS_RECUPERACAO
+                or registrar_tentativa(_chave_email('rl:recuperacao', email), JANELA_TENTATIVAS) > LIMITE_PEDIDOS_RECUPERACAO):
+            return _resposta_limite_excedido()
         # Resposta idempotente: sempre 200
         usuario = Usuario.query.filter_by(email=email).first()
         if usuario:
             # Gera token seguro e registra com expiração de 1h
+            # Um único instante para created_at, expires_at e o log
+            agora = datetime.utcnow()
             token = secrets.token_urlsafe(32)
-            expires = datetime.utcnow() + timedelta(hours=1)
             prt = PasswordResetToken(
                 id_usuario=usuario.id_usuario,
-                token=token,
-                expires_at=expires
+                token=_hash_token(token),  # o token em texto só vai no email
+                created_at=agora,
+                expires_at=agora + timedelta(hours=1)
+            )
+            # Remove os tokens antigos do usuário que não servem mais (tabela não cresce sem limite)
+            db.session.execute(
+                db.delete(PasswordResetToken).where(
+                    PasswordResetToken.id_usuario == usuario.id_usuario,
+                    PasswordResetToken.inativos(agora)
+                )
             )
             db.session.add(prt)
+            registrar_log_no_commit(usuario.id_usuario, 'Solicitação de recuperação de senha', data_hora=agora)
             db.session.commit()
 
-            # Log
-            try:
-                log = LogsAcesso(
-                    id_usuario=usuario.id_usuario,
-                    acao='Solicitação de recuperação de senha',
-                    data_hora=datetime.utcnow()
-                )
-                db.session.add(log)
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
-
             # Em produção, o token deve ser enviado por e-mail com link seguro.
             # Tentamos enviar o e-mail; se falhar, ainda retornamos 200 para não vazar existência de contas.
             frontend = os.environ.get('FRONTEND_URL', 'http://localhost:5000')
@@ -242,32 +332,9 @@ def forgot_password():
             assunto = 'Recuperação de senha - Orçamento Serviços'
             corpo = f"Olá {usuario.nome},\n\nRecebemos uma solicitação para redefinir sua senha. Acesse o link abaixo para criar uma nova senha (válido por 1 hora):\n\n{reset_link}\n\nSe você não solicitou, ignore esta mensagem.\n\nAtenciosamente,\nEquipe"
 
-            try:
-                ok, msg = send_email(subject=assunto, body=corpo, to=[usuario.email])
-                if not ok:
-                    # registra no log, mas não falha a resposta para o cliente (idempotência)
-                    try:
-                        log = LogsAcesso(
-                            id_usuario=usuario.id_usuario,
-                            acao=f'Falha ao enviar email de recuperação para {usuario.email}: {msg}',
-                            data_hora=datetime.utcnow()
-                        )
-                        db.session.add(log)
-                        db.session.commit()
-                    except Exception:
-                        db.session.rollback()
-            except Exception:
-                # qualquer erro de envio não impede a resposta (mantemos idempotência)
-                try:
-                    log = LogsAcesso(
-                        id_usuario=usuario.id_usuario,
-                        acao=f'Exceção ao tentar enviar email de recuperação para {usuario.email}',
-                        data_hora=datetime.utcnow()
-                    )
-                    db.session.add(log)
-                    db.session.commit()
-                except Exception:
-                    db.session.rollback()
+            # Envio em segundo plano: a resposta não espera o SMTP
+            agendar_envio(_enviar_email_recuperacao, current_app._get_current_object(),
+                          usuario.id_usuario, usuario.email, assunto, corpo)
 
             return jsonify({'mensagem': 'Se o email existir, enviaremos instruções.', 'token_teste': token}), 200
 
@@ -277,6 +344,17 @@ def forgot_password():
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
 
 
+def _enviar_email_recuperacao(app, id_usuario, email, assunto, corpo):
+    """Roda fora da requisição (agendar_envio): falhas só vão para o log, a resposta já foi dada."""
+    with app.app_context():
+        try:
+            ok, msg = send_email(subject=assunto, body=corpo, to=[email])
+            if not ok:
+                registrar_log(id_usuario, f'Falha ao enviar email de recuperação para {email}: {msg}')
+        except Exception:
+            registrar_log(id_usuario, f'Exceção ao tentar enviar email de recuperação para {email}')
+
+
 # ========================================
 # ROTA: RESET DE SENHA
 # POST /api/auth/reset-password
@@ -293,27 +371,27 @@ def reset_password():
         if len(nova) < 6:
             return jsonify({'erro': 'Senha deve ter pelo menos 6 caracteres'}), 400
 
-        prt = PasswordResetToken.query.filter_by(token=token).first()
-        if not prt or prt.used_at is not None or prt.expires_at < datetime.utcnow():
+        chave_ip = f'rl:reset:ip:{request.remote_addr}'
+        if contar_tentativas(chave_ip) >= LIMITE_FALHAS_RESET_IP:
+            return _resposta_limite_excedido()
+
+        # Um único instante para a validação, o used_at e o log
+        agora = datetime.utcnow()
+        prt = PasswordResetToken.query.filter_by(token=_hash_token(token)).first()
+        if not prt or prt.used_at is not None or prt.expires_at < agora:
+            registrar_tentativa(chave_ip, JANELA_TENTATIVAS)
             return jsonify({'erro': 'Token inválido ou expirado'}), 400
 
-        usuario = Usuario.query.get_or_404(prt.id_usuario)
+        usuario = db.session.get(Usuario, prt.id_usuario)
+        if usuario is None:
+            return jsonify({'erro': 'Token inválido ou expirado'}), 400
         usuario.definir_senha(nova)
-        prt.used_at = datetime.utcnow()
+        prt.used_at = agora
+        # Troca de senha, token usado e log no mesmo commit: a auditoria não se perde
+        registrar_log_na_transacao(usuario.id_usuario, 'Senha redefinida por token', data_hora=agora)
 
         db.session.commit()
-
-        # Log
-        try:
-            log = LogsAcesso(
-                id_usuario=usuario.id_usuario,
-                acao='Senha redefinida por token',
-                data_hora=datetime.utcnow()
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
+        invalidar_usuario(usuario.id_usuario)
 
         return jsonify({'mensagem': 'Senha redefinida com sucesso!'}), 200
     except Exception as e:
@@ -351,7 +429,15 @@ def atualizar_perfil():
     Recebe: FormData com nome, email, telefone, status e avatar (opcional)
     Retorna: dados do usuário atualizado ou erro
     """
+    avatar_salvo = None  # removido do disco se o commit não acontecer
     try:
+        # Objeto do usuário resolvido uma vez (cada current_user.x passa pelo proxy)
+        usuario = current_user._get_current_object()
+        
+        # Corpo grande demais é recusado antes de o formulário ser lido
+        if request.content_length and request.content_length > AVATAR_TAMANHO_MAXIMO + _FOLGA_FORMULARIO:
+            return jsonify({'erro': 'Arquivo de avatar muito grande'}), 413
+        
         # Pega os dados do formulário
         nome = request.form.get('nome')
         email = request.form.get('email')
@@ -362,64 +448,61 @@ def atualizar_perfil():
         if not nome or not email:
             return jsonify({'erro': 'Nome e email são obrigatórios'}), 400
         
-        if len(nome) > 80:
-            return jsonify({'erro': 'Nome muito longo (máximo 80 caracteres)'}), 400
-        
-        if len(email) > 50:
-            return jsonify({'erro': 'Email muito longo (máximo 50 caracteres)'}), 400
+        erro_tamanho = validar_tamanhos(request.form, LIMITES_USUARIO, ERROS_TAMANHO_USUARIO)
+        if erro_tamanho:
+            return erro_tamanho
         
-        # Verifica se o email já está sendo usado por outro usuário
-        usuario_existente = Usuario.query.filter(
-            Usuario.email == email,
-            Usuario.id_usuario != current_user.id_usuario
-        ).first()
+        # Email de outro usuário é barrado pela restrição UNIQUE no UPDATE (IntegrityError abaixo)
         
-        if usuario_existente:
-            return jsonify({'erro': 'Este email já está sendo usado por outro usuário'}), 400
+        # Um único instante para o nome do avatar e o log
+        agora = datetime.utcnow()
         
         # Processa upload de avatar se houver
         if 'avatar' in request.files:
             arquivo = request.files['avatar']
             if arquivo and arquivo.filename:
                 # Gera um nome único para o arquivo
-                extensao = arquivo.filename.rsplit('.', 1)[1].lower()
-                nome_arquivo = f'avatar_{current_user.id_usuario}_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.{extensao}'
+                extensao = arquivo.filename.rsplit('.', 1)[-1].lower()
+                if extensao not in AVATAR_EXTENSOES:
+                    return jsonify({'erro': 'Formato de avatar não suportado'}), 400
+                nome_arquivo = f'avatar_{usuario.id_usuario}_{agora.strftime("%Y%m%d_%H%M%S")}.{extensao}'
                 
                 # Salva o arquivo
-                caminho = os.path.join('static', 'uploads', 'avatars', nome_arquivo)
-                os.makedirs(os.path.dirname(caminho), exist_ok=True)
-                arquivo.save(caminho)
+                if not _salvar_avatar(arquivo, nome_arquivo):
+                    return jsonify({'erro': 'Arquivo de avatar muito grande'}), 413
+                avatar_salvo = nome_arquivo
                 
                 # Atualiza a URL do avatar
-                current_user.avatar_url = f'/avatar/{nome_arquivo}'
+                usuario.avatar_url = f'/avatar/{nome_arquivo}'
         
         # Atualiza os dados do usuário
-        current_user.nome = nome
-        current_user.email = email
-        current_user.telefone = telefone
-        current_user.status = status
+        usuario.nome = nome
+        usuario.email = email
+        usuario.telefone = telefone
+        usuario.status = status
         
-        # Salva no banco de dados
-        db.session.commit()
-        
-        # Registra a ação no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao='Perfil atualizado',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        # Salva no banco de dados (com o log, que só vale se o commit acontecer)
+        registrar_log_no_commit(usuario.id_usuario, 'Perfil atualizado', data_hora=agora)
         db.session.commit()
+        invalidar_usuario(usuario.id_usuario)
         
         # Retorna sucesso
         return jsonify({
             'mensagem': 'Perfil atualizado com sucesso!',
-            'usuario': current_user.para_dict()
+            'usuario': usuario.para_dict()
         }), 200
         
+    except RequestEntityTooLarge:
+        # Corpo acima de MAX_CONTENT_LENGTH (também sem Content-Length): o werkzeug para de ler
+        return jsonify({'erro': 'Arquivo de avatar muito grande'}), 413
+    except IntegrityError:
+        db.session.rollback()
+        _remover_avatar(avatar_salvo)
+        return jsonify({'erro': 'Este email já está sendo usado por outro usuário'}), 400
     except Exception as e:
         # Se deu erro, desfaz as alterações no banco
         db.session.rollback()
+        _remover_avatar(avatar_salvo)
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
 
 # ========================================
@@ -435,6 +518,9 @@ def alterar_senha():
     Retorna: mensagem de sucesso ou erro
     """
     try:
+        # Objeto do usuário resolvido uma vez (cada current_user.x passa pelo proxy)
+        usuario = current_user._get_current_object()
+        
         # Pega os dados enviados pelo cliente (JSON)
         dados = request.get_json()
         
@@ -454,23 +540,16 @@ def alterar_senha():
             return jsonify({'erro': 'Nova senha deve ter pelo menos 6 caracteres'}), 400
         
         # Verifica se a senha atual está correta
-        if not current_user.verificar_senha(senha_atual):
+        if not usuario.verificar_senha(senha_atual):
             return jsonify({'erro': 'Senha atual incorreta'}), 401
         
         # Define a nova senha
-        current_user.definir_senha(nova_senha)
+        usuario.definir_senha(nova_senha)
         
-        # Salva no banco de dados
-        db.session.commit()
-        
-        # Registra a ação no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao='Senha alterada',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        # Salva no banco de dados (com o log, que só vale se o commit acontecer)
+        registrar_log_no_commit(usuario.id_usuario, 'Senha alterada')
         db.session.commit()
+        invalidar_usuario(usuario.id_usuario)
         
         # Retorna sucesso
         return jsonify({
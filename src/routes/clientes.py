@@ -6,12 +6,43 @@
 # Importações necessárias
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
-from src.models.models import db, Cliente, LogsAcesso, Endereco
-from datetime import datetime
+from src.models.models import db, Cliente, Endereco, Orcamento
+from src.utils.consulta_utils import obter_do_usuario
+from src.utils.json_utils import responder_lista_json
+from src.utils.paginacao_utils import cabecalho_link, ler_parametros_paginacao, paginar_consulta, paginar_por_chave
+from src.utils.log_utils import registrar_log_no_commit
+from src.utils.validacao_utils import LIMITES_CLIENTE, montar_erros_tamanho, validar_tamanhos
 
 # Cria um blueprint para as rotas de clientes
 clientes_bp = Blueprint('clientes', __name__)
 
+# Respostas de erro de tamanho já serializadas (uma por campo)
+ERROS_TAMANHO_CLIENTE = montar_erros_tamanho(LIMITES_CLIENTE)
+
+# Linhas lidas do banco (e serializadas) por vez na listagem completa
+LOTE_LISTAGEM = 200
+
+
+def _consulta_lista_clientes(id_usuario):
+    """
+    SELECT só das colunas de Cliente.para_dict() (mesmas chaves), sem montar objetos ORM:
+    cada linha vira dict direto por Row._asdict().
+    """
+    return (
+        db.select(
+            Cliente.id_cliente,
+            Cliente.id_usuario,
+            Cliente.nome,
+            Cliente.telefone,
+            Cliente.email,
+            Cliente.endereco,
+        )
+        .where(Cliente.id_usuario == id_usuario)
+        # Ordem estável para a paginação
+        .order_by(Cliente.id_cliente)
+    )
+
+
 # ========================================
 # ROTA: LISTAR TODOS OS CLIENTES
 # GET /api/clientes/
@@ -21,19 +52,38 @@ clientes_bp = Blueprint('clientes', __name__)
 def listar_clientes():
     """
     Lista todos os clientes cadastrados
-    Retorna: lista com todos os clientes
+    Parâmetros opcionais: page e per_page (paginação) ou after (a partir do id_cliente informado)
+    Retorna: lista com os clientes (todos, se nenhum parâmetro de paginação for enviado)
     """
     try:
-        # Busca todos os clientes do usuário logado
-        clientes = Cliente.query.filter_by(id_usuario=current_user.id_usuario).all()
+        consulta = _consulta_lista_clientes(current_user.id_usuario)
+        page, per_page, after = ler_parametros_paginacao()
         
-        # Converte para formato JSON
-        lista_clientes = [cliente.para_dict() for cliente in clientes]
+        # Paginação por chave: usa o índice da PK, sem OFFSET nem COUNT
+        if after is not None:
+            linhas, proximo = paginar_por_chave(consulta, Cliente.id_cliente, after, per_page)
+            return jsonify({
+                'clientes': [linha._asdict() for linha in linhas],
+                'per_page': per_page,
+                'proximo': proximo
+            }), 200
         
-        return jsonify({
-            'clientes': lista_clientes,
-            'total': len(lista_clientes)
-        }), 200
+        # Paginação por página: COUNT(*) + LIMIT/OFFSET no banco
+        if page is not None:
+            linhas, total = paginar_consulta(consulta, page, per_page)
+            resposta = jsonify({
+                'clientes': [linha._asdict() for linha in linhas],
+                'total': total,
+                'page': page,
+                'per_page': per_page
+            })
+            resposta.headers['Link'] = cabecalho_link(page, per_page, total)
+            return resposta, 200
+        
+        # Sem paginação: lista completa (formato usado pelas telas), lida em lotes e enviada em partes
+        resultado = db.session.execute(consulta.execution_options(yield_per=LOTE_LISTAGEM))
+        # O cursor e a conexão ficam em uso até o fim do download (ver responder_lista_json)
+        return responder_lista_json('clientes', (linha._asdict() for linha in resultado), LOTE_LISTAGEM)
         
     except Exception as e:
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
@@ -52,7 +102,9 @@ def buscar_cliente(id_cliente):
     """
     try:
         # Busca o cliente pelo ID (retorna erro 404 se não encontrar)
-        cliente = Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        cliente = obter_do_usuario(Cliente, id_cliente)
+        if cliente is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
         
         return jsonify({
             'cliente': cliente.para_dict()
@@ -90,17 +142,9 @@ def cadastrar_cliente():
         if not nome:
             return jsonify({'erro': 'Nome é obrigatório'}), 400
         
-        if len(nome) > 80:
-            return jsonify({'erro': 'Nome muito longo (máximo 80 caracteres)'}), 400
-        
-        if telefone and len(telefone) > 11:
-            return jsonify({'erro': 'Telefone muito longo (máximo 11 caracteres)'}), 400
-        
-        if email and len(email) > 50:
-            return jsonify({'erro': 'Email muito longo (máximo 50 caracteres)'}), 400
-        
-        if endereco and len(endereco) > 55:
-            return jsonify({'erro': 'Endereço muito longo (máximo 55 caracteres)'}), 400
+        erro_tamanho = validar_tamanhos(dados, LIMITES_CLIENTE, ERROS_TAMANHO_CLIENTE)
+        if erro_tamanho:
+            return erro_tamanho
         
         # Cria o novo cliente
         novo_cliente = Cliente(
@@ -113,15 +157,8 @@ def cadastrar_cliente():
         
         # Salva no banco
         db.session.add(novo_cliente)
-        db.session.commit()
-        
-        # Registra no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Cliente cadastrado: {nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        # Log gravado junto com a confirmação do cadastro (descartado se houver rollback)
+        registrar_log_no_commit(current_user.id_usuario, f'Cliente cadastrado: {nome}')
         db.session.commit()
         
         return jsonify({
@@ -148,49 +185,37 @@ def atualizar_cliente(id_cliente):
     """
     try:
         # Busca o cliente
-        cliente = Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        cliente = obter_do_usuario(Cliente, id_cliente)
+        if cliente is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
         dados = request.get_json()
         
         if not dados:
             return jsonify({'erro': 'Nenhum dado foi enviado'}), 400
         
+        # Valida o tamanho dos campos enviados
+        erro_tamanho = validar_tamanhos(dados, LIMITES_CLIENTE, ERROS_TAMANHO_CLIENTE)
+        if erro_tamanho:
+            return erro_tamanho
+        
         # Atualiza apenas os campos enviados
         if 'nome' in dados:
             nome = dados['nome']
             if not nome:
                 return jsonify({'erro': 'Nome não pode ser vazio'}), 400
-            if len(nome) > 80:
-                return jsonify({'erro': 'Nome muito longo (máximo 80 caracteres)'}), 400
             cliente.nome = nome
         
         if 'telefone' in dados:
-            telefone = dados['telefone']
-            if telefone and len(telefone) > 11:
-                return jsonify({'erro': 'Telefone muito longo (máximo 11 caracteres)'}), 400
-            cliente.telefone = telefone
+            cliente.telefone = dados['telefone']
         
         if 'email' in dados:
-            email = dados['email']
-            if email and len(email) > 50:
-                return jsonify({'erro': 'Email muito longo (máximo 50 caracteres)'}), 400
-            cliente.email = email
+            cliente.email = dados['email']
         
         if 'endereco' in dados:
-            endereco = dados['endereco']
-            if endereco and len(endereco) > 55:
-                return jsonify({'erro': 'Endereço muito longo (máximo 55 caracteres)'}), 400
-            cliente.endereco = endereco
+            cliente.endereco = dados['endereco']
         
-        # Salva as alterações
-        db.session.commit()
-        
-        # Registra no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Cliente atualizado: {cliente.nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        # Salva as alterações (com o log, que só vale se o commit acontecer)
+        registrar_log_no_commit(current_user.id_usuario, f'Cliente atualizado: {cliente.nome}')
         db.session.commit()
         
         return jsonify({
@@ -218,26 +243,23 @@ def excluir_cliente(id_cliente):
     """
     try:
         # Busca o cliente
-        cliente = Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        cliente = obter_do_usuario(Cliente, id_cliente)
+        if cliente is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
         nome_cliente = cliente.nome
         
         # Verifica se o cliente tem orçamentos
-        if cliente.orcamentos:
+        tem_orcamentos = db.session.query(
+            db.exists().where(Orcamento.id_cliente == id_cliente)
+        ).scalar()
+        if tem_orcamentos:
             return jsonify({
                 'erro': 'Não é possível excluir cliente que possui orçamentos cadastrados'
             }), 400
         
         # Exclui o cliente
         db.session.delete(cliente)
-        db.session.commit()
-        
-        # Registra no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Cliente excluído: {nome_cliente}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Cliente excluído: {nome_cliente}')
         db.session.commit()
         
         return jsonify({
@@ -257,7 +279,9 @@ def excluir_cliente(id_cliente):
 @login_required
 def listar_enderecos(id_cliente):
     try:
-        cliente = Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        cliente = obter_do_usuario(Cliente, id_cliente)
+        if cliente is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
         enderecos = [e.para_dict() for e in cliente.enderecos]
         return jsonify({'enderecos': enderecos, 'total': len(enderecos)}), 200
     except Exception as e:
@@ -268,7 +292,8 @@ def listar_enderecos(id_cliente):
 @login_required
 def criar_endereco(id_cliente):
     try:
-        Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        if obter_do_usuario(Cliente, id_cliente) is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
         dados = request.get_json() or {}
 
         logradouro = (dados.get('logradouro') or '').strip()
@@ -290,14 +315,7 @@ def criar_endereco(id_cliente):
         if end.is_padrao:
             Endereco.query.filter_by(id_cliente=id_cliente, is_padrao=True).update({'is_padrao': False})
         db.session.add(end)
-        db.session.commit()
-
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Endereço criado para cliente {id_cliente}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Endereço criado para cliente {id_cliente}')
         db.session.commit()
 
         return jsonify({'mensagem': 'Endereço criado com sucesso!', 'endereco': end.para_dict()}), 201
@@ -310,8 +328,11 @@ def criar_endereco(id_cliente):
 @login_required
 def atualizar_endereco(id_cliente, id_endereco):
     try:
-        Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
-        end = Endereco.query.filter_by(id_cliente=id_cliente, id_endereco=id_endereco).first_or_404()
+        if obter_do_usuario(Cliente, id_cliente) is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
+        end = db.session.get(Endereco, id_endereco)
+        if end is None or end.id_cliente != id_cliente:
+            return jsonify({'erro': 'Endereço não encontrado'}), 404
         dados = request.get_json() or {}
 
         if 'logradouro' in dados:
@@ -340,14 +361,7 @@ def atualizar_endereco(id_cliente, id_endereco):
                 Endereco.query.filter_by(id_cliente=id_cliente, is_padrao=True).update({'is_padrao': False})
             end.is_padrao = is_padrao
 
-        db.session.commit()
-
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Endereço atualizado {id_endereco} do cliente {id_cliente}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Endereço atualizado {id_endereco} do cliente {id_cliente}')
         db.session.commit()
 
         return jsonify({'mensagem': 'Endereço atualizado com sucesso!', 'endereco': end.para_dict()}), 200
@@ -360,17 +374,13 @@ def atualizar_endereco(id_cliente, id_endereco):
 @login_required
 def excluir_endereco(id_cliente, id_endereco):
     try:
-        Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
-        end = Endereco.query.filter_by(id_cliente=id_cliente, id_endereco=id_endereco).first_or_404()
+        if obter_do_usuario(Cliente, id_cliente) is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
+        end = db.session.get(Endereco, id_endereco)
+        if end is None or end.id_cliente != id_cliente:
+            return jsonify({'erro': 'Endereço não encontrado'}), 404
         db.session.delete(end)
-        db.session.commit()
-
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Endereço excluído {id_endereco} do cliente {id_cliente}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Endereço excluído {id_endereco} do cliente {id_cliente}')
         db.session.commit()
 
         return jsonify({'mensagem': 'Endereço excluído com sucesso!'}), 200
@@ -383,18 +393,14 @@ def excluir_endereco(id_cliente, id_endereco):
 @login_required
 def definir_endereco_padrao(id_cliente, id_endereco):
     try:
-        Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        if obter_do_usuario(Cliente, id_cliente) is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
         Endereco.query.filter_by(id_cliente=id_cliente, is_padrao=True).update({'is_padrao': False})
-        end = Endereco.query.filter_by(id_cliente=id_cliente, id_endereco=id_endereco).first_or_404()
+        end = db.session.get(Endereco, id_endereco)
+        if end is None or end.id_cliente != id_cliente:
+            return jsonify({'erro': 'Endereço não encontrado'}), 404
         end.is_padrao = True
-        db.session.commit()
-
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Endereço {id_endereco} definido como padrão do cliente {id_cliente}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Endereço {id_endereco} definido como padrão do cliente {id_cliente}')
         db.session.commit()
 
         return jsonify({'mensagem': 'Endereço definido como padrão com sucesso!', 'endereco': end.para_dict()}), 200
@@ -7,9 +7,11 @@ import os
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from src.models.models import db, Empresa, LogsAcesso
-from datetime import datetime
+from src.models.models import db, Empresa
+from src.utils.consulta_utils import obter_do_usuario
+from src.utils.log_utils import registrar_log
 
 empresas_bp = Blueprint('empresas', __name__)
 
@@ -87,8 +89,10 @@ def cadastrar_empresa():
             return jsonify({'erro': 'E-mail é obrigatório.'}), 400
 
         # Evita duplicidade de CNPJ com mensagem amigável
-        empresa_existente = Empresa.query.filter(Empresa.cnpj == cnpj_numeros, Empresa.id_usuario == current_user.id_usuario).first()
-        if empresa_existente:
+        cnpj_em_uso = db.session.execute(
+            db.select(Empresa.id_empresa).filter(Empresa.cnpj == cnpj_numeros, Empresa.id_usuario == current_user.id_usuario).limit(1)
+        ).scalar() is not None
+        if cnpj_em_uso:
             return jsonify({'erro': 'CNPJ já cadastrado.'}), 400
 
         logo_path = _salvar_logo(logo_file)
@@ -105,18 +109,15 @@ def cadastrar_empresa():
         db.session.add(nova_empresa)
         db.session.commit()
 
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Empresa cadastrada: {nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, f'Empresa cadastrada: {nome}')
 
         return jsonify({
             'mensagem': 'Empresa cadastrada com sucesso!',
             'empresa': nova_empresa.para_dict()
         }), 201
+    except RequestEntityTooLarge:
+        # Upload acima de MAX_CONTENT_LENGTH (ver main.py)
+        return jsonify({'erro': 'Arquivo muito grande'}), 413
     except IntegrityError:
         db.session.rollback()
         return jsonify({'erro': 'Não foi possível salvar. Verifique se o CNPJ já está cadastrado.'}), 400
@@ -132,16 +133,12 @@ def cadastrar_empresa():
 @login_required
 def excluir_empresa(id_empresa):
     try:
-        empresa = Empresa.query.filter_by(id_empresa=id_empresa, id_usuario=current_user.id_usuario).first_or_404()
+        empresa = obter_do_usuario(Empresa, id_empresa)
+        if empresa is None:
+            return jsonify({'erro': 'Empresa não encontrada'}), 404
         db.session.delete(empresa)
         db.session.commit()
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Empresa excluída: {empresa.nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, f'Empresa excluída: {empresa.nome}')
         return jsonify({'mensagem': 'Empresa excluída com sucesso!'}), 200
     except Exception as e:
         db.session.rollback()
@@ -156,7 +153,9 @@ def excluir_empresa(id_empresa):
 @login_required
 def obter_empresa(id_empresa):
     try:
-        empresa = Empresa.query.filter_by(id_empresa=id_empresa, id_usuario=current_user.id_usuario).first_or_404()
+        empresa = obter_do_usuario(Empresa, id_empresa)
+        if empresa is None:
+            return jsonify({'erro': 'Empresa não encontrada'}), 404
         return jsonify({'empresa': empresa.para_dict()}), 200
     except Exception as e:
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
@@ -170,7 +169,9 @@ def obter_empresa(id_empresa):
 @login_required
 def atualizar_empresa(id_empresa):
     try:
-        empresa = Empresa.query.filter_by(id_empresa=id_empresa, id_usuario=current_user.id_usuario).first_or_404()
+        empresa = obter_do_usuario(Empresa, id_empresa)
+        if empresa is None:
+            return jsonify({'erro': 'Empresa não encontrada'}), 404
 
         if request.content_type and request.content_type.startswith('multipart/form-data'):
             nome = request.form.get('nome', empresa.nome)
@@ -204,11 +205,13 @@ def atualizar_empresa(id_empresa):
             return jsonify({'erro': 'E-mail é obrigatório.'}), 400
 
         if cnpj_numeros != empresa.cnpj:
-            existe = Empresa.query.filter(
-                Empresa.cnpj == cnpj_numeros,
-                Empresa.id_empresa != id_empresa,
-                Empresa.id_usuario == current_user.id_usuario
-            ).first()
+            existe = db.session.execute(
+                db.select(Empresa.id_empresa).filter(
+                    Empresa.cnpj == cnpj_numeros,
+                    Empresa.id_empresa != id_empresa,
+                    Empresa.id_usuario == current_user.id_usuario
+                ).limit(1)
+            ).scalar() is not None
             if existe:
                 return jsonify({'erro': 'CNPJ já cadastrado.'}), 400
 
@@ -225,15 +228,12 @@ def atualizar_empresa(id_empresa):
 
         db.session.commit()
 
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Empresa atualizada: {empresa.nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, f'Empresa atualizada: {empresa.nome}')
 
         return jsonify({'mensagem': 'Empresa atualizada com sucesso!', 'empresa': empresa.para_dict()}), 200
+    except RequestEntityTooLarge:
+        # Upload acima de MAX_CONTENT_LENGTH (ver main.py)
+        return jsonify({'erro': 'Arquivo muito grande'}), 413
     except IntegrityError:
         db.session.rollback()
         return jsonify({'erro': 'Não foi possível salvar. Verifique se o CNPJ já está cadastrado.'}), 400
@@ -4,17 +4,24 @@
 # ========================================
 
 # Importações necessárias
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload, selectinload, raiseload
+from collections import Counter
+from datetime import timedelta
 from decimal import Decimal
 import os
-import base64
 import secrets
+from io import BytesIO
 import smtplib
 from email.message import EmailMessage
 from html import escape
 from src.utils.email_utils import send_email, get_smtp_config
+from src.utils.consulta_utils import obter_do_usuario
+from src.utils.log_utils import registrar_log, registrar_log_no_commit
+from src.utils.etag_utils import resposta_json_condicional
+from src.utils.paginacao_utils import ler_parametros_paginacao, paginar_consulta
+from src.utils.pdf_utils import PDF_TEMPLATE, CSS_ORCAMENTO, formatar_brl, obter_logo_data_uri
 
 from src.models.models import (
     db,
@@ -22,10 +29,10 @@ from src.models.models import (
     Servico,
     Orcamento,
     OrcamentoServicos,
-    LogsAcesso,
     Venda,
     VendaItem,
     Empresa,
+    Usuario,
 )
 
 try:
@@ -35,17 +42,127 @@ except Exception:
     # Mantém a API funcional mesmo sem o pacote para outras rotas
     WEASYPRINT_AVAILABLE = False
 
+# Configuração de fontes e CSS do PDF criadas uma única vez por processo:
+# o WeasyPrint não precisa reindexar as fontes nem reinterpretar o CSS a cada requisição
+FONT_CONFIG = None
+PDF_CSS = None
+if WEASYPRINT_AVAILABLE:
+    try:
+        try:
+            from weasyprint.text.fonts import FontConfiguration
+        except ImportError:
+            from weasyprint.fonts import FontConfiguration  # WeasyPrint < 53
+        FONT_CONFIG = FontConfiguration()
+        PDF_CSS = CSS(string=CSS_ORCAMENTO, font_config=FONT_CONFIG)
+    except Exception:
+        WEASYPRINT_AVAILABLE = False
+
 
 # Cria um blueprint para as rotas de orçamentos
 orcamentos_bp = Blueprint('orcamentos', __name__)
 
 
-def _obter_orcamento_do_usuario(id_orcamento: int):
-    """Retorna o orçamento pertencente ao usuário logado ou 404."""
-    return Orcamento.query.filter_by(
-        id_orcamento=id_orcamento,
-        id_usuario=current_user.id_usuario
-    ).first_or_404()
+def _opcoes_carregamento_orcamento(bloquear_lazy_load=False):
+    """Opções de eager loading usadas por para_dict (cliente, usuário, empresa e itens com serviço).
+
+    Evita o padrão N+1: uma consulta com JOIN + uma consulta IN para os itens,
+    em vez de SELECTs extras por orçamento.
+    bloquear_lazy_load: em debug, qualquer outro relacionamento acessado levanta erro
+    (raiseload), revelando um N+1 novo. Usar só em rotas que não fazem commit depois.
+    """
+    opcoes = [
+        joinedload(Orcamento.cliente),
+        joinedload(Orcamento.usuario),
+        joinedload(Orcamento.empresa),
+        selectinload(Orcamento.orcamento_servicos).joinedload(OrcamentoServicos.servico),
+    ]
+    if bloquear_lazy_load and current_app.debug:
+        opcoes.append(raiseload('*'))
+    return tuple(opcoes)
+
+
+def _consulta_lista_orcamentos(id_usuario):
+    """
+    SELECT só das colunas que a listagem devolve, com as mesmas chaves de Orcamento.para_dict().
+    Sem montar objetos ORM: cliente/usuário/empresa vêm por JOIN e o numero_usuario por
+    ROW_NUMBER() (em vez de um COUNT por orçamento).
+    """
+    return (
+        db.select(
+            Orcamento.id_orcamento,
+            Orcamento.id_cliente,
+            Orcamento.id_usuario,
+            Orcamento.id_empresa,
+            Orcamento.data_criacao,
+            Orcamento.valor_total,
+            Orcamento.status,
+            db.func.coalesce(Orcamento.cliente_nome_snapshot, Cliente.nome).label('cliente_nome'),
+            Cliente.telefone.label('cliente_telefone'),
+            Cliente.email.label('cliente_email'),
+            Cliente.endereco.label('cliente_endereco'),
+            Usuario.nome.label('usuario_nome'),
+            Empresa.nome.label('empresa_nome'),
+            Orcamento.id_endereco,
+            db.func.row_number().over(
+                partition_by=Orcamento.id_usuario,
+                order_by=Orcamento.id_orcamento,
+            ).label('numero_usuario'),
+        )
+        .outerjoin(Cliente, Cliente.id_cliente == Orcamento.id_cliente)
+        .outerjoin(Usuario, Usuario.id_usuario == Orcamento.id_usuario)
+        .outerjoin(Empresa, Empresa.id_empresa == Orcamento.id_empresa)
+        .where(Orcamento.id_usuario == id_usuario)
+        .order_by(Orcamento.data_criacao.desc(), Orcamento.id_orcamento.desc())
+    )
+
+
+def _consulta_itens_orcamentos(ids_orcamentos):
+    """Itens dos orçamentos informados, com as mesmas chaves de OrcamentoServicos.para_dict()."""
+    tem_snapshot = OrcamentoServicos.servico_nome_snapshot.isnot(None)
+    return (
+        db.select(
+            OrcamentoServicos.id_orcamento,
+            OrcamentoServicos.id_servico,
+            OrcamentoServicos.quantidade,
+            OrcamentoServicos.valor_unitario,
+            OrcamentoServicos.subtotal,
+            db.case((tem_snapshot, OrcamentoServicos.servico_nome_snapshot), else_=Servico.nome).label('servico_nome'),
+            db.case((tem_snapshot, OrcamentoServicos.servico_descricao_snapshot), else_=Servico.descricao).label('servico_descricao'),
+        )
+        .outerjoin(Servico, Servico.id_servicos == OrcamentoServicos.id_servico)
+        .where(OrcamentoServicos.id_orcamento.in_(ids_orcamentos))
+    )
+
+
+def _obter_orcamento_do_usuario(id_orcamento: int, com_relacionamentos: bool = False, bloquear_lazy_load: bool = False):
+    """
+    Retorna o orçamento pertencente ao usuário logado ou None.
+    com_relacionamentos=True já carrega cliente, empresa e itens com serviço (telas de detalhe/PDF/email).
+    """
+    opcoes = _opcoes_carregamento_orcamento(bloquear_lazy_load) if com_relacionamentos else ()
+    return obter_do_usuario(Orcamento, id_orcamento, opcoes)
+
+
+def _validar_itens_payload(itens):
+    """
+    Valida e converte os itens enviados na criação do orçamento em uma única passada.
+    Retorna (lista de (id_servico, quantidade), None) ou (None, mensagem de erro).
+    """
+    itens_validos = []
+    for item in itens:
+        if not isinstance(item, dict) or not item.get('id_servico'):
+            return None, 'Cada item deve conter id_servico'
+        try:
+            id_servico = int(item['id_servico'])  # a tela pode enviar o id como texto
+        except (TypeError, ValueError):
+            return None, 'id_servico inválido'
+        quantidade = item.get('quantidade', 1)
+        if not isinstance(quantidade, int) or isinstance(quantidade, bool):
+            return None, 'quantidade deve ser inteiro válido'
+        if quantidade < 1:
+            return None, 'quantidade deve ser maior ou igual a 1'
+        itens_validos.append((id_servico, quantidade))
+    return itens_validos, None
 
 
 # ========================================
@@ -85,28 +202,41 @@ def criar_orcamento():
         if not isinstance(itens, list) or len(itens) == 0:
             return jsonify({'erro': 'Lista de itens é obrigatória e não pode ser vazia'}), 400
 
+        # Valida todos os itens antes de qualquer consulta ao banco
+        itens_validos, erro = _validar_itens_payload(itens)
+        if erro:
+            return jsonify({'erro': erro}), 400
+
         # Verifica cliente e empresa pertencentes ao usuário logado
-        cliente = Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
-        empresa = Empresa.query.filter_by(id_empresa=id_empresa, id_usuario=current_user.id_usuario).first_or_404()
-
-        # Agrega itens duplicados somando quantidades e valida IDs e quantidades
-        mapa_quantidades = {}
-        for item in itens:
-            id_servico = item.get('id_servico')
-            quantidade = item.get('quantidade', 1)
-            if not id_servico:
-                return jsonify({'erro': 'Cada item deve conter id_servico'}), 400
-            if not isinstance(quantidade, int):
-                return jsonify({'erro': 'quantidade deve ser inteiro válido'}), 400
-            if quantidade < 1:
-                return jsonify({'erro': 'quantidade deve ser maior ou igual a 1'}), 400
-            mapa_quantidades[id_servico] = mapa_quantidades.get(id_servico, 0) + quantidade
+        cliente = obter_do_usuario(Cliente, id_cliente)
+        if cliente is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
+        empresa = obter_do_usuario(Empresa, id_empresa)
+        if empresa is None:
+            return jsonify({'erro': 'Empresa não encontrada'}), 404
+
+        # Agrega itens duplicados somando quantidades
+        mapa_quantidades = Counter()
+        for id_servico, quantidade in itens_validos:
+            mapa_quantidades[id_servico] += quantidade
+
+        # Busca todos os serviços do orçamento em uma única consulta (IN)
+        servicos = {
+            s.id_servicos: s
+            for s in Servico.query.filter(
+                Servico.id_servicos.in_(list(mapa_quantidades)),
+                Servico.id_usuario == current_user.id_usuario
+            ).all()
+        }
+        faltando = [id_servico for id_servico in mapa_quantidades if id_servico not in servicos]
+        if faltando:
+            return jsonify({'erro': 'Serviço não encontrado', 'ids_nao_encontrados': faltando}), 404
 
         # Monta os itens com dados do serviço atual e calcula totais
         valor_total = Decimal('0.00')
         itens_calculados = []
         for id_servico, quantidade_total in mapa_quantidades.items():
-            servico = Servico.query.filter_by(id_servicos=id_servico, id_usuario=current_user.id_usuario).first_or_404()
+            servico = servicos[id_servico]
             valor_unitario = Decimal(str(servico.valor))
             subtotal = (valor_unitario * quantidade_total)
             valor_total += subtotal
@@ -114,7 +244,9 @@ def criar_orcamento():
                 'id_servico': servico.id_servicos,
                 'quantidade': quantidade_total,
                 'valor_unitario': valor_unitario,
-                'subtotal': subtotal
+                'subtotal': subtotal,
+                'servico_nome': servico.nome,
+                'servico_descricao': servico.descricao
             })
 
         # Cria o orçamento
@@ -122,39 +254,35 @@ def criar_orcamento():
             id_cliente=cliente.id_cliente,
             id_usuario=current_user.id_usuario,
             id_empresa=empresa.id_empresa,
-            data_criacao=datetime.utcnow(),
-            valor_total=valor_total
+            valor_total=valor_total,
+            cliente_nome_snapshot=cliente.nome
         )
         db.session.add(novo_orcamento)
         db.session.flush()  # Gera id_orcamento para relacionar itens
 
-        # Cria os itens do orçamento
-        for ic in itens_calculados:
-            item_orc = OrcamentoServicos(
-                id_orcamento=novo_orcamento.id_orcamento,
-                id_servico=ic['id_servico'],
-                quantidade=ic['quantidade'],
-                valor_unitario=ic['valor_unitario'],
-                subtotal=ic['subtotal']
-            )
-            db.session.add(item_orc)
-
-        # Salva tudo
-        db.session.commit()
-
-        # Log de criação
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Orçamento criado (ID {novo_orcamento.id_orcamento}) para cliente {cliente.nome}',
-            data_hora=datetime.utcnow()
+        # Cria os itens do orçamento em um único INSERT com vários registros
+        db.session.execute(
+            OrcamentoServicos.__table__.insert(),
+            [
+                {
+                    'id_orcamento': novo_orcamento.id_orcamento,
+                    'id_servico': ic['id_servico'],
+                    'quantidade': ic['quantidade'],
+                    'valor_unitario': ic['valor_unitario'],
+                    'subtotal': ic['subtotal'],
+                    'servico_nome_snapshot': ic['servico_nome'],
+                    'servico_descricao_snapshot': ic['servico_descricao'],
+                }
+                for ic in itens_calculados
+            ]
         )
-        db.session.add(log)
+
+        # Log de criação (enfileirado só se o commit do orçamento for confirmado)
+        registrar_log_no_commit(current_user.id_usuario, f'Orçamento criado (ID {novo_orcamento.id_orcamento}) para cliente {cliente.nome}')
         db.session.commit()
 
-        # Monta resposta detalhada
-        itens_resp = []
-        for rel in OrcamentoServicos.query.filter_by(id_orcamento=novo_orcamento.id_orcamento).all():
-            itens_resp.append(rel.para_dict())
+        # Monta resposta detalhada com os itens já calculados (mesmas chaves de OrcamentoServicos.para_dict)
+        itens_resp = [{'id_orcamento': novo_orcamento.id_orcamento, **ic} for ic in itens_calculados]
 
         return jsonify({
             'mensagem': 'Orçamento criado com sucesso!',
@@ -177,17 +305,35 @@ def criar_orcamento():
 def listar_orcamentos():
     """
     Lista todos os orçamentos com informações de cliente, data, serviços, valor total e status.
+    Parâmetros opcionais: page e per_page (paginação). Sem eles, retorna a lista completa.
     """
     try:
-        orcamentos = Orcamento.query.filter_by(id_usuario=current_user.id_usuario).order_by(Orcamento.data_criacao.desc()).all()
-        resultado = []
-        for o in orcamentos:
-            itens = [rel.para_dict() for rel in o.orcamento_servicos]
-            resultado.append({
-                'orcamento': o.para_dict(),
-                'itens': itens
-            })
-        return jsonify({'orcamentos': resultado, 'total': len(resultado)}), 200
+        consulta = _consulta_lista_orcamentos(current_user.id_usuario)
+        page, per_page, _ = ler_parametros_paginacao()
+
+        if page is not None:
+            linhas, total = paginar_consulta(consulta, page, per_page)
+        else:
+            linhas = db.session.execute(consulta).all()
+            total = len(linhas)
+
+        # Itens de todos os orçamentos da página em uma única consulta
+        itens_por_orcamento = {}
+        if linhas:
+            ids = [linha.id_orcamento for linha in linhas]
+            for item in db.session.execute(_consulta_itens_orcamentos(ids)):
+                itens_por_orcamento.setdefault(item.id_orcamento, []).append(item._asdict())
+
+        resultado = [
+            {'orcamento': linha._asdict(), 'itens': itens_por_orcamento.get(linha.id_orcamento, [])}
+            for linha in linhas
+        ]
+
+        dados = {'orcamentos': resultado, 'total': total}
+        if page is not None:
+            dados['page'] = page
+            dados['per_page'] = per_page
+        return resposta_json_condicional(dados)
     except Exception as e:
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
 
@@ -204,9 +350,11 @@ def detalhar_orcamento(id_orcamento):
     Retorna um orçamento específico e seus itens.
     """
     try:
-        orcamento = Orcamento.query.filter_by(id_orcamento=id_orcamento, id_usuario=current_user.id_usuario).first_or_404()
+        orcamento = _obter_orcamento_do_usuario(id_orcamento, com_relacionamentos=True, bloquear_lazy_load=True)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         itens = [rel.para_dict() for rel in orcamento.orcamento_servicos]
-        return jsonify({'orcamento': orcamento.para_dict(), 'itens': itens}), 200
+        return resposta_json_condicional({'orcamento': orcamento.para_dict(), 'itens': itens})
     except Exception as e:
         return jsonify({'erro': f'Erro no servidor: {str(e)}'}), 500
 
@@ -234,17 +382,13 @@ def atualizar_status_orcamento(id_orcamento):
         if status_novo not in status_validos:
             return jsonify({'erro': 'Status inválido. Use: Pendente, Aprovado, Recusado, Concluído'}), 400
 
-        orcamento = Orcamento.query.filter_by(id_orcamento=id_orcamento, id_usuario=current_user.id_usuario).first_or_404()
+        orcamento = obter_do_usuario(Orcamento, id_orcamento)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         orcamento.status = status_novo
-        db.session.commit()
 
         # Log da alteração de status
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Status do orçamento {orcamento.id_orcamento} atualizado para {status_novo}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Status do orçamento {orcamento.id_orcamento} atualizado para {status_novo}')
         db.session.commit()
 
         itens = [rel.para_dict() for rel in orcamento.orcamento_servicos]
@@ -263,19 +407,15 @@ def atualizar_status_orcamento(id_orcamento):
 def excluir_orcamento(id_orcamento):
     try:
         orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         venda = Venda.query.filter_by(id_orcamento=orcamento.id_orcamento).first()
         if venda:
             return jsonify({'erro': 'Não é possível excluir um orçamento que já foi convertido em venda.'}), 400
 
         db.session.delete(orcamento)
-        db.session.commit()
 
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Orçamento excluído: {orcamento.id_orcamento}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Orçamento excluído: {orcamento.id_orcamento}')
         db.session.commit()
 
         return jsonify({'mensagem': 'Orçamento excluído com sucesso!'}), 200
@@ -293,6 +433,8 @@ def excluir_orcamento(id_orcamento):
 def converter_em_venda(id_orcamento):
     try:
         orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
 
         if orcamento.status != 'Aprovado':
             return jsonify({'erro': 'Apenas orçamentos Aprovados podem ser convertidos em venda'}), 400
@@ -309,39 +451,33 @@ def converter_em_venda(id_orcamento):
             id_orcamento=orcamento.id_orcamento,
             id_cliente=orcamento.id_cliente,
             id_usuario=current_user.id_usuario,
-            data_venda=datetime.utcnow(),
             codigo_venda=codigo,
             valor_total=orcamento.valor_total,
         )
         db.session.add(venda)
         db.session.flush()
 
-        # Copia snapshot dos itens
+        # Copia snapshot dos itens (um único INSERT com todos os registros)
         relacoes = OrcamentoServicos.query.filter_by(id_orcamento=orcamento.id_orcamento).all()
-        for rel in relacoes:
-            vi = VendaItem(
-                id_venda=venda.id_venda,
-                id_servico=rel.id_servico,
-                quantidade=rel.quantidade,
-                valor_unitario=rel.valor_unitario,
-                subtotal=rel.subtotal,
+        if relacoes:
+            db.session.execute(
+                VendaItem.__table__.insert(),
+                [
+                    {
+                        'id_venda': venda.id_venda,
+                        'id_servico': rel.id_servico,
+                        'quantidade': rel.quantidade,
+                        'valor_unitario': rel.valor_unitario,
+                        'subtotal': rel.subtotal,
+                    }
+                    for rel in relacoes
+                ]
             )
-            db.session.add(vi)
 
+        # Log (enfileirado só se a venda for confirmada)
+        registrar_log_no_commit(current_user.id_usuario, f'Orçamento {orcamento.id_orcamento} convertido em venda {venda.codigo_venda}')
         db.session.commit()
 
-        # Log
-        try:
-            log = LogsAcesso(
-                id_usuario=current_user.id_usuario,
-                acao=f'Orçamento {orcamento.id_orcamento} convertido em venda {venda.codigo_venda}',
-                data_hora=datetime.utcnow()
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-
         itens = [i.para_dict() for i in venda.itens]
         return jsonify({'mensagem': 'Conversão realizada com sucesso!', 'venda': venda.para_dict(), 'itens': itens}), 201
     except Exception as e:
@@ -364,7 +500,9 @@ def gerar_pdf_orcamento(id_orcamento):
     """
     try:
         # Busca dados do orçamento
-        orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        orcamento = _obter_orcamento_do_usuario(id_orcamento, com_relacionamentos=True, bloquear_lazy_load=True)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         cliente = orcamento.cliente
         itens = orcamento.orcamento_servicos
         empresa = orcamento.empresa or Empresa.query.filter_by(id_usuario=current_user.id_usuario).first()
@@ -401,7 +539,7 @@ def gerar_pdf_orcamento(id_orcamento):
         numero_usuario = orcamento.numero_usuario()
         numero_formatado = str(numero_usuario)
 
-        cliente_nome = cliente.nome if cliente else 'Cliente'
+        cliente_nome = orcamento.cliente_nome or 'Cliente'
         cliente_tel = format_phone(cliente.telefone if cliente else '')
         cliente_email = (cliente.email if cliente and cliente.email else 'Não informado')
         cliente_endereco = (cliente.endereco if cliente and cliente.endereco else 'Não informado')
@@ -433,141 +571,36 @@ def gerar_pdf_orcamento(id_orcamento):
                 logo_absolute_path = caminho
                 break
 
-        def formatar_brl(valor_decimal):
-            valor = float(valor_decimal)
-            txt = f"{valor:,.2f}"
-            txt = txt.replace(',', 'X').replace('.', ',').replace('X', '.')
-            return f"R$ {txt}"
-
         # Primeiro tenta usar WeasyPrint (HTML -> PDF) para um layout rico
         if WEASYPRINT_AVAILABLE:
-            logo_data_uri = ''
-            if logo_absolute_path:
-                try:
-                    with open(logo_absolute_path, 'rb') as f:
-                        b64 = base64.b64encode(f.read()).decode('utf-8')
-                        mime = 'image/png'
-                        if logo_absolute_path.endswith('.jpg') or logo_absolute_path.endswith('.jpeg'):
-                            mime = 'image/jpeg'
-                        elif logo_absolute_path.endswith('.svg'):
-                            mime = 'image/svg+xml'
-                        logo_data_uri = f"data:{mime};base64,{b64}"
-                except Exception:
-                    logo_data_uri = ''
-
-            linhas_itens = ''.join([
-                f"<tr>"
-                f"<td class='center'>{rel.quantidade}</td>"
-                f"<td><div class='title'>{esc(rel.servico.nome if rel.servico else 'Serviço')}</div>"
-                f"<div class='desc'>{esc((rel.servico.descricao or '') if rel.servico else '')}</div></td>"
-                f"<td class='right'>{formatar_brl(rel.valor_unitario)}</td>"
-                f"<td class='right'>{formatar_brl(rel.subtotal)}</td>"
-                f"</tr>"
-                for rel in itens
-            ])
-            if not linhas_itens:
-                linhas_itens = "<tr><td colspan='4' class='center'>Nenhum serviço vinculado</td></tr>"
-
-            html_conteudo = f"""
-            <html>
-            <head>
-                <meta charset='utf-8'>
-                <style>
-                    @page {{ size: A4; margin: 18mm 15mm; }}
-                    :root {{ --accent: #0b57a4; --text: #1f2a37; --muted: #556070; }}
-                    body {{ font-family: 'Inter', 'Segoe UI', sans-serif; color: var(--text); font-size:12px; }}
-                    header.header {{ display:flex; align-items:center; justify-content:space-between; gap:16px; padding-bottom:12px; border-bottom:2px solid #e5e9f2; }}
-                    header.header .company {{ text-align:right; font-size:11px; color:var(--muted); }}
-                    header.header img {{ max-height:80px; object-fit:contain; }}
-                    h1 {{ text-align:center; color:var(--accent); margin:18px 0 10px; font-size:20px; letter-spacing:1px; }}
-                    .meta {{ display:flex; justify-content:space-between; margin-top:12px; font-size:11px; color:var(--muted); }}
-                    .info-grid {{ display:flex; flex-wrap:wrap; gap:16px; margin:18px 0; }}
-                    .panel {{ flex:1; min-width:220px; border:1px solid #d9e1ef; border-radius:12px; padding:12px; background:#f8fafc; }}
-                    .panel h2 {{ margin:0 0 8px; font-size:13px; color:var(--accent); }}
-                    .panel p {{ margin:3px 0; font-size:11px; }}
-                    table.items {{ width:100%; border-collapse:collapse; margin-top:6px; }}
-                    table.items th {{ background:var(--accent); color:#fff; padding:8px 6px; font-weight:600; font-size:11px; text-align:left; }}
-                    table.items td {{ padding:8px 6px; border-bottom:1px solid #edf2f7; vertical-align:top; font-size:11px; }}
-                    table.items td.center {{ text-align:center; }}
-                    table.items td.right {{ text-align:right; }}
-                    table.items .title {{ font-weight:600; }}
-                    table.items .desc {{ font-size:10px; color:var(--muted); margin-top:2px; }}
-                    .total {{ margin-top:12px; text-align:right; font-size:14px; font-weight:700; color:var(--accent); }}
-                    .notes {{ margin-top:16px; font-size:10px; color:var(--muted); }}
-                    .signature {{ display:flex; gap:40px; margin-top:90px; padding-top:30px; }}
-                    .signature .block {{ flex:1; text-align:center; font-size:11px; }}
-                    .signature .line {{ height:1px; background:#333; margin-bottom:6px; }}
-                    footer {{ margin-top:24px; font-size:10px; color:var(--muted); text-align:center; }}
-                </style>
-            </head>
-            <body>
-                <header class="header">
-                    <div class="logo">{f'<img src="{logo_data_uri}"/>' if logo_data_uri else ''}</div>
-                    <div class="company">
-                        <div style="font-weight:700; font-size:14px;">{esc(empresa_nome)}</div>
-                        <div>{esc(empresa_endereco)}</div>
-                        <div>CNPJ: {esc(empresa_cnpj)}</div>
-                        <div>Tel: {esc(empresa_phone)} · Email: {esc(empresa_email)}</div>
-                    </div>
-                </header>
-                <section class="info-grid">
-                    <div class="panel">
-                        <h2>Dados do Orçamento</h2>
-                        <p><strong>Número:</strong> #{numero_formatado}</p>
-                        <p><strong>Emissão:</strong> {orcamento.data_criacao.strftime('%d/%m/%Y %H:%M')}</p>
-                        <p><strong>Validade:</strong> {validade_str}</p>
-                        <p><strong>Responsável:</strong> {esc(responsavel_nome)}</p>
-                    </div>
-                    <div class="panel">
-                        <h2>Empresa Prestadora</h2>
-                        <p><strong>Razão Social:</strong> {esc(empresa_nome)}</p>
-                        <p><strong>CNPJ:</strong> {esc(empresa_cnpj)}</p>
-                        <p><strong>Endereço:</strong> {esc(empresa_endereco)}</p>
-                        <p><strong>Telefone:</strong> {esc(empresa_phone)}</p>
-                        <p><strong>E-mail:</strong> {esc(empresa_email)}</p>
-                    </div>
-                    <div class="panel">
-                        <h2>Cliente</h2>
-                        <p><strong>Nome:</strong> {esc(cliente_nome)}</p>
-                        <p><strong>CPF:</strong> {esc(cliente_cpf)}</p>
-                        <p><strong>Telefone:</strong> {esc(cliente_tel or 'Não informado')}</p>
-                        <p><strong>E-mail:</strong> {esc(cliente_email)}</p>
-                        <p><strong>Endereço:</strong> {esc(cliente_endereco)}</p>
-                    </div>
-                </section>
-                <h1>Serviços e Valores</h1>
-                <table class="items">
-                    <thead>
-                        <tr><th style="width:70px;">Qtd</th><th>Descrição do Item</th><th style="width:120px;">Valor Unitário</th><th style="width:140px;">Subtotal</th></tr>
-                    </thead>
-                    <tbody>
-                    {linhas_itens}
-                    </tbody>
-                </table>
-                <div class="total">TOTAL GERAL: {formatar_brl(orcamento.valor_total)}</div>
-                <div class="notes">
-                    <p>Este orçamento é válido por 15 dias corridos a partir da data de emissão. Os valores poderão ser ajustados caso haja alteração no escopo dos serviços.</p>
-                </div>
-                <div class="signature">
-                    <div class="block">
-                        <div class="line"></div>
-                        <p>{esc(empresa_nome)}</p>
-                        <small>Responsável</small>
-                    </div>
-                    <div class="block">
-                        <div class="line"></div>
-                        <p>{esc(cliente_nome)}</p>
-                        <small>Cliente</small>
-                    </div>
-                </div>
-                <footer>Documento gerado automaticamente pelo Planejador de Orçamentos.</footer>
-            </body>
-            </html>
-            """
+            logo_data_uri = obter_logo_data_uri(logo_absolute_path)
+
+            html_conteudo = PDF_TEMPLATE.render(
+                orcamento=orcamento,
+                itens=itens,
+                logo_data_uri=logo_data_uri,
+                numero=numero_formatado,
+                validade=validade_str,
+                responsavel=responsavel_nome,
+                empresa={
+                    'nome': empresa_nome,
+                    'endereco': empresa_endereco,
+                    'cnpj': empresa_cnpj,
+                    'telefone': empresa_phone,
+                    'email': empresa_email,
+                },
+                cliente={
+                    'nome': cliente_nome,
+                    'cpf': cliente_cpf,
+                    'telefone': cliente_tel,
+                    'email': cliente_email,
+                    'endereco': cliente_endereco,
+                },
+            )
 
             try:
-                from weasyprint import HTML
-                pdf_bytes = HTML(string=html_conteudo).write_pdf()
+                buffer = BytesIO()
+                HTML(string=html_conteudo).write_pdf(target=buffer, stylesheets=[PDF_CSS], font_config=FONT_CONFIG)
             except Exception as e:
                 return jsonify({'erro': f'WeasyPrint falhou ao gerar o PDF: {str(e)}'}), 500
 
@@ -578,7 +611,6 @@ def gerar_pdf_orcamento(id_orcamento):
             from reportlab.lib.pagesizes import A4
             from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
             from reportlab.lib.units import cm
-            from io import BytesIO
 
             # Configuração do documento
             buffer = BytesIO()
@@ -675,8 +707,8 @@ def gerar_pdf_orcamento(id_orcamento):
             table_data = [['Serviço', 'Descrição', 'Qtd.', 'Valor Unit.', 'Subtotal']]
             for item in itens:
                 table_data.append([
-                    item.servico.nome,
-                    item.servico.descricao or '-',
+                    item.servico_nome or '-',
+                    item.servico_descricao or '-',
                     str(item.quantidade),
                     formatar_brl(item.valor_unitario),
                     formatar_brl(item.subtotal)
@@ -716,8 +748,6 @@ def gerar_pdf_orcamento(id_orcamento):
             elements.append(assinatura_table)
 
             doc.build(elements)
-            pdf_bytes = buffer.getvalue()
-            buffer.close()
             if temp_logo_path:
                 try:
                     os.remove(temp_logo_path)
@@ -725,33 +755,19 @@ def gerar_pdf_orcamento(id_orcamento):
                     pass
 
         # Log de sucesso
-        try:
-            log = LogsAcesso(
-                id_usuario=current_user.id_usuario,
-                acao=f'PDF gerado para orçamento {orcamento.id_orcamento}',
-                data_hora=datetime.utcnow()
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-
-        response = make_response(pdf_bytes)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=orcamento_{numero_formatado}.pdf'
-        return response
+        registrar_log(current_user.id_usuario, f'PDF gerado para orçamento {orcamento.id_orcamento}')
+
+        # Envia o buffer direto, sem copiar os bytes do PDF para uma nova string
+        buffer.seek(0)
+        return send_file(
+            buffer,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=f'orcamento_{numero_formatado}.pdf',
+        )
     except Exception as e:
         # Log de falha
-        try:
-            log = LogsAcesso(
-                id_usuario=current_user.id_usuario,
-                acao=f'Falha ao gerar PDF do orçamento {id_orcamento}: {str(e)}',
-                data_hora=datetime.utcnow()
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
+        registrar_log(current_user.id_usuario, f'Falha ao gerar PDF do orçamento {id_orcamento}: {str(e)}')
         return jsonify({'erro': f'Erro ao gerar PDF: {str(e)}'}), 500
 
 
@@ -786,26 +802,23 @@ def iniciar_orcamento():
             return jsonify({'erro': 'id_cliente é obrigatório'}), 400
 
         # Verifica cliente
-        cliente = Cliente.query.filter_by(id_cliente=id_cliente, id_usuario=current_user.id_usuario).first_or_404()
+        cliente = obter_do_usuario(Cliente, id_cliente)
+        if cliente is None:
+            return jsonify({'erro': 'Cliente não encontrado'}), 404
 
         # Cria orçamento temporário
         orcamento_temp = Orcamento(
             id_cliente=cliente.id_cliente,
             id_usuario=current_user.id_usuario,
-            data_criacao=datetime.utcnow(),
             valor_total=Decimal('0.00'),
-            status='Em Andamento'  # Status especial para orçamentos em construção
+            status='Em Andamento',  # Status especial para orçamentos em construção
+            cliente_nome_snapshot=cliente.nome
         )
         db.session.add(orcamento_temp)
-        db.session.commit()
+        db.session.flush()  # gera o id_orcamento usado no log
 
         # Log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Orçamento temporário iniciado (ID {orcamento_temp.id_orcamento}) para cliente {cliente.nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Orçamento temporário iniciado (ID {orcamento_temp.id_orcamento}) para cliente {cliente.nome}')
         db.session.commit()
 
         return jsonify({
@@ -848,7 +861,11 @@ def adicionar_item_orcamento(id_orcamento):
 
         # Busca orçamento e serviço
         orcamento = _obter_orcamento_do_usuario(id_orcamento)
-        servico = Servico.query.filter_by(id_servicos=id_servico, id_usuario=current_user.id_usuario).first_or_404()
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
+        servico = obter_do_usuario(Servico, id_servico)
+        if servico is None:
+            return jsonify({'erro': 'Serviço não encontrado'}), 404
 
         # Verifica se é um orçamento em andamento
         if orcamento.status != 'Em Andamento':
@@ -874,7 +891,9 @@ def adicionar_item_orcamento(id_orcamento):
                 id_servico=id_servico,
                 quantidade=quantidade,
                 valor_unitario=valor_unitario,
-                subtotal=subtotal
+                subtotal=subtotal,
+                servico_nome_snapshot=servico.nome,
+                servico_descricao_snapshot=servico.descricao
             )
             db.session.add(novo_item)
 
@@ -883,15 +902,8 @@ def adicionar_item_orcamento(id_orcamento):
         valor_total = sum(item.subtotal for item in itens)
         orcamento.valor_total = valor_total
 
-        db.session.commit()
-
         # Log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Item adicionado ao orçamento {id_orcamento}: {servico.nome} (qtd: {quantidade})',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Item adicionado ao orçamento {id_orcamento}: {servico.nome} (qtd: {quantidade})')
         db.session.commit()
 
         # Retorna orçamento atualizado
@@ -921,6 +933,8 @@ def remover_item_orcamento(id_orcamento, id_servico):
     try:
         # Busca orçamento
         orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         
         if orcamento.status != 'Em Andamento':
             return jsonify({'erro': 'Apenas orçamentos em andamento podem ter itens removidos'}), 400
@@ -934,7 +948,7 @@ def remover_item_orcamento(id_orcamento, id_servico):
         if not item:
             return jsonify({'erro': 'Item não encontrado no orçamento'}), 404
 
-        nome_servico = item.servico.nome
+        nome_servico = item.servico_nome
         db.session.delete(item)
 
         # Recalcula valor total
@@ -942,15 +956,8 @@ def remover_item_orcamento(id_orcamento, id_servico):
         valor_total = sum(item.subtotal for item in itens_restantes)
         orcamento.valor_total = valor_total
 
-        db.session.commit()
-
         # Log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Item removido do orçamento {id_orcamento}: {nome_servico}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Item removido do orçamento {id_orcamento}: {nome_servico}')
         db.session.commit()
 
         # Retorna orçamento atualizado
@@ -989,6 +996,8 @@ def atualizar_quantidade_item(id_orcamento, id_servico):
 
         # Busca orçamento e item
         orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         
         if orcamento.status != 'Em Andamento':
             return jsonify({'erro': 'Apenas orçamentos em andamento podem ter quantidades alteradas'}), 400
@@ -1010,15 +1019,8 @@ def atualizar_quantidade_item(id_orcamento, id_servico):
         valor_total = sum(item.subtotal for item in itens)
         orcamento.valor_total = valor_total
 
-        db.session.commit()
-
         # Log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Quantidade atualizada no orçamento {id_orcamento}: {item.servico.nome} (nova qtd: {quantidade})',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Quantidade atualizada no orçamento {id_orcamento}: {item.servico_nome} (nova qtd: {quantidade})')
         db.session.commit()
 
         # Retorna orçamento atualizado
@@ -1047,6 +1049,8 @@ def finalizar_orcamento(id_orcamento):
     """
     try:
         orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         
         if orcamento.status != 'Em Andamento':
             return jsonify({'erro': 'Apenas orçamentos em andamento podem ser finalizados'}), 400
@@ -1058,15 +1062,9 @@ def finalizar_orcamento(id_orcamento):
 
         # Muda status para Pendente
         orcamento.status = 'Pendente'
-        db.session.commit()
 
         # Log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Orçamento {id_orcamento} finalizado e enviado para aprovação',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
+        registrar_log_no_commit(current_user.id_usuario, f'Orçamento {id_orcamento} finalizado e enviado para aprovação')
         db.session.commit()
 
         # Retorna orçamento finalizado
@@ -1105,7 +1103,9 @@ def enviar_email_orcamento(id_orcamento):
             return jsonify({'erro': 'Informe uma lista de emails válida'}), 400
 
         # Busca o orçamento
-        orcamento = _obter_orcamento_do_usuario(id_orcamento)
+        orcamento = _obter_orcamento_do_usuario(id_orcamento, com_relacionamentos=True)
+        if orcamento is None:
+            return jsonify({'erro': 'Orçamento não encontrado'}), 404
         cliente = orcamento.cliente
         itens = orcamento.orcamento_servicos
 
@@ -1114,24 +1114,9 @@ def enviar_email_orcamento(id_orcamento):
         if not smtp_cfg['host'] or not smtp_cfg['user'] or not smtp_cfg['password']:
             return jsonify({'erro': 'Serviço de e-mail não configurado no servidor (variáveis SMTP ausentes)'}), 503
 
-        # Função auxiliar para formatar valores em BRL
-        def formatar_brl(valor_decimal):
-            valor = float(valor_decimal)
-            txt = f"{valor:,.2f}"
-            txt = txt.replace(',', 'X').replace('.', ',').replace('X', '.')
-            return f"R$ {txt}"
-
         # Tenta carregar logo da empresa
-        logo_data_uri = ''
-        try:
-            base_dir = os.path.dirname(os.path.dirname(__file__))
-            logo_path = os.path.join(base_dir, 'static', 'logo.png')
-            if os.path.exists(logo_path):
-                with open(logo_path, 'rb') as f:
-                    b64 = base64.b64encode(f.read()).decode('utf-8')
-                    logo_data_uri = f"data:image/png;base64,{b64}"
-        except Exception:
-            logo_data_uri = ''
+        base_dir = os.path.dirname(os.path.dirname(__file__))
+        logo_data_uri = obter_logo_data_uri(os.path.join(base_dir, 'static', 'logo.png'))
 
         # Dados da empresa (configuráveis via variáveis de ambiente)
         EMPRESA_NOME = os.environ.get('EMPRESA_NOME', 'Sua Empresa Ltda.')
@@ -1171,7 +1156,7 @@ def enviar_email_orcamento(id_orcamento):
             </header>
             <h1>Orçamento #{orcamento.id_orcamento}</h1>
             <div class="meta">
-                <div class="cliente"><strong>Cliente:</strong> {cliente.nome} {f'<br/>{cliente.email}' if cliente.email else ''} {f'<br/>{cliente.telefone}' if cliente.telefone else ''}</div>
+                <div class="cliente"><strong>Cliente:</strong> {orcamento.cliente_nome or ''} {f'<br/>{cliente.email}' if cliente.email else ''} {f'<br/>{cliente.telefone}' if cliente.telefone else ''}</div>
                 <div class="info"><strong>Data:</strong> {orcamento.data_criacao.strftime('%d/%m/%Y %H:%M')}<br/><strong>Status:</strong> {orcamento.status}</div>
             </div>
             <table class="items" cellpadding="0" cellspacing="0">
@@ -1180,7 +1165,7 @@ def enviar_email_orcamento(id_orcamento):
                 </thead>
                 <tbody>
                 {''.join([
-                    f"<tr><td>{rel.servico.nome}</td><td>{(rel.servico.descricao or '-')}</td><td style='text-align:center'>{rel.quantidade}</td><td style='text-align:right'>{formatar_brl(rel.valor_unitario)}</td><td style='text-align:right'>{formatar_brl(rel.subtotal)}</td></tr>"
+                    f"<tr><td>{rel.servico_nome or '-'}</td><td>{(rel.servico_descricao or '-')}</td><td style='text-align:center'>{rel.quantidade}</td><td style='text-align:right'>{formatar_brl(rel.valor_unitario)}</td><td style='text-align:right'>{formatar_brl(rel.subtotal)}</td></tr>"
                     for rel in itens
                 ])}
                 </tbody>
@@ -1207,7 +1192,6 @@ def enviar_email_orcamento(id_orcamento):
             from reportlab.lib.pagesizes import A4
             from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
             from reportlab.lib.units import cm
-            from io import BytesIO
 
             buffer = BytesIO()
             doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=1*cm, leftMargin=1*cm, topMargin=1*cm, bottomMargin=1*cm)
@@ -1218,14 +1202,14 @@ def enviar_email_orcamento(id_orcamento):
 
             elements = []
             elements.append(Paragraph(f"Orçamento #{orcamento.id_orcamento}", title_style))
-            elements.append(Paragraph(f"Cliente: {cliente.nome}", normal_style))
+            elements.append(Paragraph(f"Cliente: {orcamento.cliente_nome or ''}", normal_style))
             elements.append(Spacer(1, 8))
 
             table_data = [['Serviço', 'Descrição', 'Qtd.', 'Valor Unit.', 'Subtotal']]
             for item in itens:
                 table_data.append([
-                    item.servico.nome,
-                    item.servico.descricao or '-',
+                    item.servico_nome or '-',
+                    item.servico_descricao or '-',
                     str(item.quantidade),
                     formatar_brl(item.valor_unitario),
                     formatar_brl(item.subtotal)
@@ -1253,16 +1237,7 @@ def enviar_email_orcamento(id_orcamento):
         ok, msg = send_email(subject=f'Orçamento #{orcamento.id_orcamento}', body=corpo, to=emails, attachments=attachments)
         if not ok:
             # registra log detalhado e devolve erro apropriado
-            try:
-                log = LogsAcesso(
-                    id_usuario=current_user.id_usuario,
-                    acao=f'Falha ao enviar e-mail do orçamento {orcamento.id_orcamento}: {msg}',
-                    data_hora=datetime.utcnow()
-                )
-                db.session.add(log)
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
+            registrar_log(current_user.id_usuario, f'Falha ao enviar e-mail do orçamento {orcamento.id_orcamento}: {msg}')
 
             # traduz mensagens comuns em códigos HTTP
             if 'Autenticação' in msg or 'Autenticação SMTP' in msg:
@@ -1272,17 +1247,8 @@ def enviar_email_orcamento(id_orcamento):
             return jsonify({'erro': f'Erro ao enviar e-mail: {msg}'}), 502
 
         # Log de sucesso com detalhes dos destinatários
-        try:
-            emails_str = ', '.join(emails)
-            log = LogsAcesso(
-                id_usuario=current_user.id_usuario,
-                acao=f'E-mail enviado com sucesso: orçamento {orcamento.id_orcamento} para {len(emails)} destinatário(s) - {emails_str}',
-                data_hora=datetime.utcnow()
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
+        emails_str = ', '.join(emails)
+        registrar_log(current_user.id_usuario, f'E-mail enviado com sucesso: orçamento {orcamento.id_orcamento} para {len(emails)} destinatário(s) - {emails_str}')
 
         return jsonify({
             'mensagem': 'E-mail enviado com sucesso!',
@@ -1292,16 +1258,7 @@ def enviar_email_orcamento(id_orcamento):
 
     except Exception as e:
         # Log de erro geral
-        try:
-            log = LogsAcesso(
-                id_usuario=current_user.id_usuario,
-                acao=f'Erro geral ao enviar e-mail do orçamento {id_orcamento}: {str(e)}',
-                data_hora=datetime.utcnow()
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
+        registrar_log(current_user.id_usuario, f'Erro geral ao enviar e-mail do orçamento {id_orcamento}: {str(e)}')
         
         return jsonify({'erro': f'Erro interno do servidor: {str(e)}'}), 500
 
@@ -6,8 +6,9 @@
 # Importações necessárias
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
-from src.models.models import db, Servico, LogsAcesso
-from datetime import datetime
+from src.models.models import db, Servico
+from src.utils.consulta_utils import obter_do_usuario
+from src.utils.log_utils import registrar_log
 from decimal import Decimal
 
 # Cria um blueprint para as rotas de serviços
@@ -53,7 +54,9 @@ def buscar_servico(id_servico):
     """
     try:
         # Busca o serviço pelo ID
-        servico = Servico.query.filter_by(id_servicos=id_servico, id_usuario=current_user.id_usuario).first_or_404()
+        servico = obter_do_usuario(Servico, id_servico)
+        if servico is None:
+            return jsonify({'erro': 'Serviço não encontrado'}), 404
         
         return jsonify({
             'servico': servico.para_dict()
@@ -120,13 +123,7 @@ def cadastrar_servico():
         db.session.commit()
         
         # Registra no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Serviço cadastrado: {nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, f'Serviço cadastrado: {nome}')
         
         return jsonify({
             'mensagem': 'Serviço cadastrado com sucesso!',
@@ -152,7 +149,9 @@ def atualizar_servico(id_servico):
     """
     try:
         # Busca o serviço
-        servico = Servico.query.filter_by(id_servicos=id_servico, id_usuario=current_user.id_usuario).first_or_404()
+        servico = obter_do_usuario(Servico, id_servico)
+        if servico is None:
+            return jsonify({'erro': 'Serviço não encontrado'}), 404
         dados = request.get_json()
         
         if not dados:
@@ -187,13 +186,7 @@ def atualizar_servico(id_servico):
         db.session.commit()
         
         # Registra no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Serviço atualizado: {servico.nome}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, f'Serviço atualizado: {servico.nome}')
         
         return jsonify({
             'mensagem': 'Serviço atualizado com sucesso!',
@@ -220,7 +213,9 @@ def excluir_servico(id_servico):
     """
     try:
         # Busca o serviço
-        servico = Servico.query.filter_by(id_servicos=id_servico, id_usuario=current_user.id_usuario).first_or_404()
+        servico = obter_do_usuario(Servico, id_servico)
+        if servico is None:
+            return jsonify({'erro': 'Serviço não encontrado'}), 404
         nome_servico = servico.nome
         
         # Verifica se o serviço está sendo usado em orçamentos
@@ -234,13 +229,7 @@ def excluir_servico(id_servico):
         db.session.commit()
         
         # Registra no log
-        log = LogsAcesso(
-            id_usuario=current_user.id_usuario,
-            acao=f'Serviço excluído: {nome_servico}',
-            data_hora=datetime.utcnow()
-        )
-        db.session.add(log)
-        db.session.commit()
+        registrar_log(current_user.id_usuario, f'Serviço excluído: {nome_servico}')
         
         return jsonify({
             'mensagem': f'Serviço "{nome_servico}" excluído com sucesso!'
@@ -0,0 +1,75 @@
+import gzip
+import mimetypes
+import os
+from functools import lru_cache
+
+# brotli é opcional: sem ele só a versão .gz é gerada
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+
+# Só vale a pena comprimir texto; imagens (png/jpg) já são comprimidas
+EXTENSOES_COMPRIMIVEIS = ('.html', '.js', '.css', '.svg', '.json', '.txt')
+
+
+def _comprimir_se_desatualizado(origem, destino, comprimir):
+    """Grava a versão comprimida só se não existir ou for mais antiga que o arquivo original."""
+    if os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(origem):
+        return destino
+    with open(origem, 'rb') as f:
+        dados = f.read()
+    with open(destino, 'wb') as f:
+        f.write(comprimir(dados))
+    return destino
+
+
+def gerar_versoes_comprimidas(caminhos):
+    """
+    Gera arquivo.gz (e arquivo.br com brotli instalado) ao lado de cada arquivo de texto,
+    uma vez na inicialização: a compressão não acontece a cada requisição e a resposta
+    continua sendo um arquivo enviado por send_file.
+    Retorna {caminho original: {'br': caminho, 'gzip': caminho}}.
+    Falhas de escrita (ex.: disco somente leitura) apenas deixam o arquivo sem versão comprimida.
+    """
+    versoes = {}
+    for caminho in set(caminhos):
+        if not caminho.lower().endswith(EXTENSOES_COMPRIMIVEIS):
+            continue
+        variantes = {}
+        try:
+            if BROTLI_AVAILABLE:
+                variantes['br'] = _comprimir_se_desatualizado(
+                    caminho, caminho + '.br', lambda dados: brotli.compress(dados, quality=11))
+            variantes['gzip'] = _comprimir_se_desatualizado(
+                caminho, caminho + '.gz', lambda dados: gzip.compress(dados, compresslevel=9, mtime=0))
+        except OSError:
+            pass
+        if variantes:
+            versoes[caminho] = variantes
+    return versoes
+
+
+def escolher_versao(caminho, versoes, accept_encodings):
+    """
+    Escolhe a melhor versão aceita pelo cliente (br > gzip > original).
+    Retorna (caminho a enviar, Content-Encoding ou None).
+    """
+    variantes = versoes.get(caminho)
+    if variantes:
+        for codificacao in ('br', 'gzip'):
+            if codificacao in variantes and accept_encodings.quality(codificacao) > 0:
+                return variantes[codificacao], codificacao
+    return caminho, None
+
+
+@lru_cache(maxsize=64)
+def _tipo_da_extensao(extensao):
+    return mimetypes.guess_type('arquivo' + extensao)[0] or 'application/octet-stream'
+
+
+def tipo_do_arquivo(caminho):
+    """Content-Type pela extensão; poucas extensões distintas, então o resultado fica em cache."""
+    return _tipo_da_extensao(os.path.splitext(caminho)[1].lower())
@@ -0,0 +1,34 @@
+import re
+
+from flask_login import current_user
+from sqlalchemy.dialects.postgresql import to_tsquery
+
+from src.models.models import db, documento_busca
+
+
+def obter_do_usuario(modelo, chave, opcoes=()):
+    """
+    Busca um registro pela chave primária e confere se pertence ao usuário logado.
+    db.session.get() consulta primeiro o identity map da sessão (sem SELECT se já carregado).
+    opcoes: opções de carregamento (joinedload/selectinload) aplicadas se o SELECT for feito.
+    Retorna o objeto ou None (não existe ou é de outro usuário).
+    """
+    objeto = db.session.get(modelo, chave, options=opcoes)
+    if objeto is None or objeto.id_usuario != current_user.id_usuario:
+        return None
+    return objeto
+
+
+def filtro_busca_textual(colunas, busca):
+    """
+    Filtro "alguma das colunas contém o texto buscado".
+    PostgreSQL: busca textual por prefixo de palavra ('cor' encontra 'Corte'), que usa os
+    índices GIN de indice_busca() em vez de varrer a tabela como o ILIKE '%...%'.
+    Outros bancos (SQLite em desenvolvimento): ILIKE '%busca%'.
+    """
+    termos = re.findall(r'\w+', busca)
+    if termos and db.engine.dialect.name == 'postgresql':
+        # Só letras/dígitos chegam ao to_tsquery: nenhum operador vem do usuário
+        consulta = to_tsquery(db.text("'simple'"), ' & '.join(f'{termo}:*' for termo in termos))
+        return db.or_(*(documento_busca(coluna).op('@@')(consulta) for coluna in colunas))
+    return db.or_(*(coluna.ilike(f'%{busca}%') for coluna in colunas))
@@ -1,9 +1,18 @@
 import os
 import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from email.message import EmailMessage
 from typing import List, Optional
 
 
+# Envios que não precisam do resultado na resposta (ex.: recuperação de senha) rodam
+# nestas threads: a requisição não espera o handshake SMTP (centenas de ms a segundos).
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', '2'))
+_executor_email = ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix='email')
+
+
 def _get_env(key_names, default=None):
     for k in key_names:
         v = os.environ.get(k)
@@ -12,8 +21,12 @@ def _get_env(key_names, default=None):
     return default
 
 
+@lru_cache(maxsize=1)
 def get_smtp_config():
-    """Retorna um dicionário com configuração SMTP, tentando nomes alternativos usados no projeto."""
+    """
+    Retorna um dicionário com configuração SMTP, tentando nomes alternativos usados no projeto.
+    Lido do ambiente uma vez por processo (não alterar o dict devolvido).
+    """
     host = _get_env(['SMTP_HOST', 'SMTP_SERVER'])
     user = _get_env(['SMTP_USER', 'SMTP_USERNAME'])
     password = _get_env(['SMTP_PASS', 'SMTP_PASSWORD'])
@@ -32,6 +45,50 @@ def get_smtp_config():
     }
 
 
+# Uma conexão SMTP autenticada por thread, reaproveitada entre envios:
+# evita TCP + TLS + AUTH a cada email. O noop() confirma que ela ainda está viva.
+_conexoes = threading.local()
+
+
+def _abrir_conexao(cfg):
+    # Lógica INTELIGENTE: Se for porta 465, usa conexão segura direta (SSL)
+    if cfg['port'] == 465:
+        server = smtplib.SMTP_SSL(cfg['host'], cfg['port'], timeout=cfg['timeout'])
+    else:
+        server = smtplib.SMTP(cfg['host'], cfg['port'], timeout=cfg['timeout'])
+        if cfg['tls']:
+            server.starttls()
+    try:
+        server.login(cfg['user'], cfg['password'])
+    except BaseException:
+        server.close()
+        raise
+    return server
+
+
+def _descartar_conexao():
+    server = getattr(_conexoes, 'server', None)
+    _conexoes.server = None
+    if server is not None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
+def _obter_conexao(cfg):
+    server = getattr(_conexoes, 'server', None)
+    if server is not None:
+        try:
+            if server.noop()[0] == 250:
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        _descartar_conexao()
+    _conexoes.server = _abrir_conexao(cfg)
+    return _conexoes.server
+
+
 def send_email(subject: str, body: str, to: List[str], attachments: Optional[List[dict]] = None) -> (bool, str):
     cfg = get_smtp_config()
     if not cfg['host'] or not cfg['user'] or not cfg['password']:
@@ -51,21 +108,22 @@ def send_email(subject: str, body: str, to: List[str], attachments: Optional[Lis
                 return False, f'Falha ao anexar arquivo: {e}'
 
     try:
-        # Lógica INTELIGENTE: Se for porta 465, usa conexão segura direta (SSL)
-        if cfg['port'] == 465:
-            server = smtplib.SMTP_SSL(cfg['host'], cfg['port'], timeout=cfg['timeout'])
-        else:
-            server = smtplib.SMTP(cfg['host'], cfg['port'], timeout=cfg['timeout'])
-            if cfg['tls']:
-                server.starttls()
-        
-        with server:
-            server.login(cfg['user'], cfg['password'])
-            server.send_message(msg)
+        try:
+            _obter_conexao(cfg).send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # O servidor encerrou a conexão entre o noop e o envio: reconecta uma vez
+            _descartar_conexao()
+            _obter_conexao(cfg).send_message(msg)
         return True, 'OK'
     except smtplib.SMTPAuthenticationError as e:
         return False, f'Autenticação SMTP falhou: {e}'
     except smtplib.SMTPConnectError as e:
         return False, f'Erro de conexão SMTP: {e}'
     except Exception as e:
-        return False, f'Erro ao enviar e-mail: {e}'
\ No newline at end of file
+        _descartar_conexao()
+        return False, f'Erro ao enviar e-mail: {e}'
+
+
+def agendar_envio(tarefa, *args):
+    """Executa tarefa(*args) em segundo plano. A tarefa trata os próprios erros (não há quem leia o resultado)."""
+    return _executor_email.submit(tarefa, *args)
@@ -0,0 +1,15 @@
+from flask import jsonify, request
+
+
+def resposta_json_condicional(dados):
+    """
+    Monta a resposta JSON com ETag (hash do corpo) e responde 304 sem corpo
+    quando o cliente envia If-None-Match com a mesma ETag.
+    O hash é do corpo serializado porque o para_dict() do orçamento inclui dados de
+    cliente/usuário/empresa e o numero_usuario, que mudam sem alterar a linha do orçamento.
+    """
+    resposta = jsonify(dados)
+    resposta.add_etag()
+    # Dados do usuário logado: o navegador pode guardar, mas sempre revalida com a ETag
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta.make_conditional(request)
@@ -0,0 +1,113 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import chain, islice
+
+from flask import Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+# orjson é opcional: sem ele o provider usa o json da biblioteca padrão,
+# mantendo o mesmo formato de saída (Decimal -> número, datas em ISO 8601)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def converter_para_json(obj):
+    """Converte tipos que o serializador não conhece (Decimal dos campos Numeric, datas)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    raise TypeError(f'Objeto do tipo {type(obj).__name__} não é serializável em JSON')
+
+
+def serializar_bytes(obj):
+    """JSON compacto em bytes (orjson quando instalado), com as mesmas conversões do provider."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=converter_para_json, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=converter_para_json, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def gerar_lista_json(chave, itens, tamanho_lote=200):
+    """
+    Gera {"<chave>": [...], "total": N} em partes, para Response(stream_with_context(...)).
+    Os itens são serializados à medida que chegam do banco (lotes de tamanho_lote por escrita):
+    nem a lista de dicts nem o corpo inteiro ficam em memória de uma vez.
+    Um erro no meio da leitura já não pode virar 500 (o status 200 foi enviado): o JSON é
+    fechado mesmo assim, com os itens já lidos e a chave "erro" indicando que a lista está incompleta.
+    """
+    yield b'{"' + chave.encode('utf-8') + b'":['
+    total = 0
+    lote = []
+    erro = None
+    try:
+        for item in itens:
+            lote.append(serializar_bytes(item))
+            total += 1
+            if len(lote) >= tamanho_lote:
+                yield (b',' if total > len(lote) else b'') + b','.join(lote)
+                lote = []
+    except Exception as e:
+        print(f"Erro ao gerar a lista de {chave}: {e}")
+        erro = f'Erro no servidor: {str(e)}'
+    if lote:
+        yield (b',' if total > len(lote) else b'') + b','.join(lote)
+    fim = b'],"total":' + str(total).encode('ascii')
+    if erro is not None:
+        fim += b',"erro":' + serializar_bytes(erro)
+    yield fim + b'}\n'
+
+
+def responder_lista_json(chave, itens, tamanho_lote=200):
+    """
+    Response em partes com gerar_lista_json. O primeiro lote é lido antes de a resposta sair:
+    erros da consulta (os mais comuns) ainda chegam ao except da rota e viram 500.
+    Atenção: com yield_per o cursor (e a conexão do pool) fica reservado até o fim do download,
+    então um cliente lento segura uma conexão do banco durante toda a transferência.
+    """
+    itens = iter(itens)
+    primeiro_lote = list(islice(itens, tamanho_lote))
+    partes = gerar_lista_json(chave, chain(primeiro_lote, itens), tamanho_lote)
+    return Response(stream_with_context(partes), mimetype='application/json')
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Provider JSON do Flask baseado em orjson.
+    Os para_dict() podem devolver Decimal e datetime direto, sem float()/isoformat() por linha.
+    """
+
+    default = staticmethod(converter_para_json)
+
+    def _dumps_bytes(self, obj, sort_keys, indent):
+        opcoes = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            opcoes |= orjson.OPT_SORT_KEYS
+        if indent:
+            opcoes |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=converter_para_json, option=opcoes)
+
+    def dumps(self, obj, **kwargs):
+        if not ORJSON_AVAILABLE:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj, kwargs.get('sort_keys', self.sort_keys), kwargs.get('indent')).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        """
+        Usado por jsonify(): entrega os bytes do orjson direto ao Response,
+        sem decodificar para str e codificar de novo (relevante nas listagens grandes).
+        """
+        if not ORJSON_AVAILABLE:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = (self.compact is None and self._app.debug) or self.compact is False
+        corpo = self._dumps_bytes(obj, self.sort_keys, indentar) + b'\n'
+        return self._app.response_class(corpo, mimetype=self.mimetype)
+
+    def loads(self, s, **kwargs):
+        if not ORJSON_AVAILABLE:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
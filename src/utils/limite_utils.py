@@ -0,0 +1,66 @@
+import threading
+import time
+
+from src.utils.redis_utils import RedisError, cliente_redis
+
+
+# Contadores de tentativas por chave em janelas fixas (ex.: falhas de login por IP/email).
+# Com Redis (INCR + EXPIRE) valem para todos os workers; sem ele, cada processo conta as suas.
+_contadores = {}
+_lock = threading.Lock()
+_MAXIMO_CHAVES_LOCAIS = 10000
+
+
+def _limpar_expirados(agora):
+    for chave in [c for c, (expira_em, _) in _contadores.items() if expira_em <= agora]:
+        del _contadores[chave]
+
+
+def contar_tentativas(chave):
+    """Quantas tentativas já foram registradas na janela atual da chave."""
+    if cliente_redis is not None:
+        try:
+            valor = cliente_redis.get(chave)
+            return int(valor) if valor is not None else 0
+        except RedisError:
+            pass
+    with _lock:
+        item = _contadores.get(chave)
+        if item is None or item[0] <= time.monotonic():
+            return 0
+        return item[1]
+
+
+def registrar_tentativa(chave, janela):
+    """Soma uma tentativa na chave (a janela de `janela` segundos começa na primeira). Retorna o total."""
+    if cliente_redis is not None:
+        try:
+            # MULTI/EXEC: cria a chave já com TTL (SET NX EX) e incrementa (INCR mantém o TTL).
+            # Nunca fica uma chave sem expiração, mesmo se o processo cair no meio.
+            with cliente_redis.pipeline(transaction=True) as pipe:
+                pipe.set(chave, 0, ex=janela, nx=True)
+                pipe.incr(chave)
+                _, total = pipe.execute()
+            return total
+        except RedisError:
+            pass
+    with _lock:
+        agora = time.monotonic()
+        if len(_contadores) >= _MAXIMO_CHAVES_LOCAIS:
+            _limpar_expirados(agora)
+        expira_em, total = _contadores.get(chave, (0, 0))
+        if expira_em <= agora:
+            expira_em, total = agora + janela, 0
+        _contadores[chave] = (expira_em, total + 1)
+        return total + 1
+
+
+def limpar_tentativas(chave):
+    """Zera a chave (ex.: login correto zera as falhas daquele email)."""
+    if cliente_redis is not None:
+        try:
+            cliente_redis.delete(chave)
+        except RedisError:
+            pass
+    with _lock:
+        _contadores.pop(chave, None)
@@ -0,0 +1,131 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models.models import db, LogsAcesso
+
+
+# Os registros de LogsAcesso são gravados em lote por uma thread em segundo plano,
+# fora do tempo de resposta da requisição.
+LOG_LOTE_MAXIMO = 100  # máximo de registros por INSERT
+LOG_INTERVALO = float(os.environ.get('LOG_FLUSH_INTERVAL', '0.2'))  # espera máxima (segundos) para fechar um lote
+
+_fila = queue.Queue()
+_lock = threading.Lock()
+_thread = None
+_pid = None
+_app = None
+
+
+def _montar_registro(id_usuario, acao, data_hora):
+    # Todos os registros com as mesmas chaves: o lote vira um único INSERT executemany.
+    # Sem data_hora informada vale o momento da ação, não o da gravação do lote.
+    return {
+        'id_usuario': id_usuario,
+        'acao': acao[:100],  # limite da coluna acao
+        'data_hora': data_hora if data_hora is not None else datetime.utcnow(),
+    }
+
+
+def registrar_log(id_usuario, acao, data_hora=None):
+    """Enfileira um registro de LogsAcesso. Deve ser chamado dentro de uma requisição."""
+    _garantir_thread()
+    _fila.put(_montar_registro(id_usuario, acao, data_hora))
+
+
+def registrar_log_no_commit(id_usuario, acao, data_hora=None):
+    """
+    Como registrar_log, mas o registro só vai para a fila quando a transação atual
+    da sessão for confirmada (commit). Se houver rollback, o log é descartado.
+    Usar antes do db.session.commit() da alteração registrada.
+    """
+    _garantir_thread()
+    db.session.info.setdefault('logs_pendentes', []).append(_montar_registro(id_usuario, acao, data_hora))
+
+
+def registrar_log_na_transacao(id_usuario, acao, data_hora=None):
+    """
+    Grava o registro na própria transação da alteração (mesmo commit, sem passar pela fila).
+    Para eventos de segurança cujo log não pode se perder se o processo cair logo após o commit.
+    """
+    db.session.add(LogsAcesso(**_montar_registro(id_usuario, acao, data_hora)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _enfileirar_logs_confirmados(sessao):
+    for registro in sessao.info.pop('logs_pendentes', ()):
+        _fila.put(registro)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_logs_pendentes(sessao):
+    sessao.info.pop('logs_pendentes', None)
+
+
+def _garantir_thread():
+    """Inicia a thread de gravação no processo atual (cada worker do gunicorn tem a sua)."""
+    global _thread, _pid, _app
+    if _pid == os.getpid() and _thread is not None and _thread.is_alive():
+        return
+    with _lock:
+        if _pid == os.getpid() and _thread is not None and _thread.is_alive():
+            return
+        _app = current_app._get_current_object()
+        _pid = os.getpid()
+        _thread = threading.Thread(target=_consumir_fila, name='logs-acesso', daemon=True)
+        _thread.start()
+
+
+def _retirar_lote(espera):
+    """Aguarda o primeiro registro e junta os seguintes até fechar o lote ou acabar o intervalo."""
+    try:
+        lote = [_fila.get(timeout=espera)] if espera else [_fila.get_nowait()]
+    except queue.Empty:
+        return []
+    limite = time.monotonic() + (espera or 0)
+    while len(lote) < LOG_LOTE_MAXIMO:
+        restante = limite - time.monotonic()
+        try:
+            lote.append(_fila.get(timeout=restante) if restante > 0 else _fila.get_nowait())
+        except queue.Empty:
+            break
+    return lote
+
+
+def _gravar_lote(lote):
+    if not lote:
+        return
+    with _app.app_context():
+        try:
+            # INSERT do Core direto na tabela: sem objetos ORM nem unit of work
+            db.session.execute(LogsAcesso.__table__.insert(), lote)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro ao gravar logs de acesso: {e}")
+
+
+def _consumir_fila():
+    while True:
+        _gravar_lote(_retirar_lote(LOG_INTERVALO))
+
+
+def descarregar_logs():
+    """Grava imediatamente tudo o que estiver na fila (usado no encerramento do processo)."""
+    if _app is None or _pid != os.getpid():
+        return
+    while True:
+        lote = _retirar_lote(0)
+        if not lote:
+            break
+        _gravar_lote(lote)
+
+
+atexit.register(descarregar_logs)
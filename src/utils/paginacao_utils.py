@@ -0,0 +1,75 @@
+from urllib.parse import urlencode
+
+from flask import request
+
+from src.models.models import db
+
+
+# Limites de itens por página aceitos pelas rotas de listagem
+POR_PAGINA_PADRAO = 20
+POR_PAGINA_MAXIMO = 100
+
+
+def ler_parametros_paginacao():
+    """
+    Lê ?page=, ?per_page= e ?after= da query string.
+    Retorna (page, per_page, after). page/after ficam None quando não enviados:
+    nesse caso a rota devolve a lista completa, como as telas antigas esperam.
+    """
+    page = request.args.get('page', type=int)
+    after = request.args.get('after', type=int)
+    per_page = request.args.get('per_page', POR_PAGINA_PADRAO, type=int)
+
+    if page is not None and page < 1:
+        page = 1
+    if per_page < 1 or per_page > POR_PAGINA_MAXIMO:
+        per_page = POR_PAGINA_PADRAO
+    return page, per_page, after
+
+
+def paginar_consulta(consulta, page, per_page):
+    """
+    Paginação por página de um db.select() de colunas (sem objetos ORM):
+    SELECT COUNT(*) sobre a consulta + LIMIT/OFFSET no banco, sem carregar todas as linhas.
+    Retorna (linhas, total).
+    """
+    total = db.session.execute(
+        db.select(db.func.count()).select_from(consulta.order_by(None).subquery())
+    ).scalar()
+    linhas = db.session.execute(consulta.limit(per_page).offset((page - 1) * per_page)).all()
+    return linhas, total
+
+
+def cabecalho_link(page, per_page, total):
+    """
+    Valor do cabeçalho Link (RFC 8288) com first/prev/next/last para a paginação por página.
+    Mantém os demais parâmetros da query string (filtros, busca).
+    """
+    ultima = max(1, -(-total // per_page))
+    paginas = {'first': 1}
+    if page > 1:
+        paginas['prev'] = min(page - 1, ultima)
+    if page < ultima:
+        paginas['next'] = page + 1
+    paginas['last'] = ultima
+    parametros = request.args.to_dict()
+    links = []
+    for rel, numero in paginas.items():
+        parametros.update(page=numero, per_page=per_page)
+        links.append(f'<{request.base_url}?{urlencode(parametros)}>; rel="{rel}"')
+    return ', '.join(links)
+
+
+def paginar_por_chave(consulta, coluna, after, per_page):
+    """
+    Paginação por chave (keyset) de um db.select() de colunas: WHERE coluna > :after ORDER BY coluna LIMIT N.
+    Usa o índice da coluna em vez de varrer as linhas puladas pelo OFFSET.
+    Retorna (linhas, proximo) — proximo é o valor a enviar em ?after= ou None no fim.
+    """
+    itens = db.session.execute(
+        consulta.where(coluna > after).order_by(None).order_by(coluna).limit(per_page + 1)
+    ).all()
+    tem_mais = len(itens) > per_page
+    itens = itens[:per_page]
+    proximo = getattr(itens[-1], coluna.key) if tem_mais else None
+    return itens, proximo
@@ -0,0 +1,164 @@
+import base64
+import os
+from functools import lru_cache
+
+from jinja2 import Environment
+
+
+# Troca os separadores do formato americano (1,234.56) pelos brasileiros (1.234,56) em uma passada
+_SEPARADORES_BRL = str.maketrans({',': '.', '.': ','})
+
+
+def formatar_brl(valor_decimal):
+    """Formata um valor numérico no padrão monetário brasileiro (R$ 1.234,56)."""
+    return f"R$ {float(valor_decimal):,.2f}".translate(_SEPARADORES_BRL)
+
+
+def obter_logo_data_uri(caminho):
+    """
+    Retorna a logo em data URI (base64) para embutir no HTML, ou '' se não houver arquivo.
+    O resultado fica em cache por (caminho, mtime): a leitura e a codificação só se repetem
+    quando o arquivo é trocado (ex.: nova logo enviada pela empresa).
+    """
+    if not caminho:
+        return ''
+    try:
+        mtime = os.path.getmtime(caminho)
+    except OSError:
+        return ''
+    return _ler_logo_data_uri(caminho, mtime)
+
+
+@lru_cache(maxsize=32)
+def _ler_logo_data_uri(caminho, mtime):
+    try:
+        with open(caminho, 'rb') as f:
+            b64 = base64.b64encode(f.read()).decode('utf-8')
+    except OSError:
+        return ''
+    mime = 'image/png'
+    if caminho.endswith('.jpg') or caminho.endswith('.jpeg'):
+        mime = 'image/jpeg'
+    elif caminho.endswith('.svg'):
+        mime = 'image/svg+xml'
+    return f"data:{mime};base64,{b64}"
+
+
+# ========================================
+# TEMPLATE HTML DO PDF DO ORÇAMENTO (WeasyPrint)
+# Compilado uma única vez na importação do módulo; autoescape substitui o escape() manual
+# ========================================
+
+# Folha de estilo do PDF: separada do HTML para ser interpretada uma vez só
+# (ver PDF_CSS em routes/orcamentos.py)
+CSS_ORCAMENTO = """
+@page { size: A4; margin: 18mm 15mm; }
+:root { --accent: #0b57a4; --text: #1f2a37; --muted: #556070; }
+body { font-family: 'Inter', 'Segoe UI', sans-serif; color: var(--text); font-size:12px; }
+header.header { display:flex; align-items:center; justify-content:space-between; gap:16px; padding-bottom:12px; border-bottom:2px solid #e5e9f2; }
+header.header .company { text-align:right; font-size:11px; color:var(--muted); }
+header.header img { max-height:80px; object-fit:contain; }
+h1 { text-align:center; color:var(--accent); margin:18px 0 10px; font-size:20px; letter-spacing:1px; }
+.meta { display:flex; justify-content:space-between; margin-top:12px; font-size:11px; color:var(--muted); }
+.info-grid { display:flex; flex-wrap:wrap; gap:16px; margin:18px 0; }
+.panel { flex:1; min-width:220px; border:1px solid #d9e1ef; border-radius:12px; padding:12px; background:#f8fafc; }
+.panel h2 { margin:0 0 8px; font-size:13px; color:var(--accent); }
+.panel p { margin:3px 0; font-size:11px; }
+table.items { width:100%; border-collapse:collapse; margin-top:6px; }
+table.items th { background:var(--accent); color:#fff; padding:8px 6px; font-weight:600; font-size:11px; text-align:left; }
+table.items td { padding:8px 6px; border-bottom:1px solid #edf2f7; vertical-align:top; font-size:11px; }
+table.items td.center { text-align:center; }
+table.items td.right { text-align:right; }
+table.items .title { font-weight:600; }
+table.items .desc { font-size:10px; color:var(--muted); margin-top:2px; }
+.total { margin-top:12px; text-align:right; font-size:14px; font-weight:700; color:var(--accent); }
+.notes { margin-top:16px; font-size:10px; color:var(--muted); }
+.signature { display:flex; gap:40px; margin-top:90px; padding-top:30px; }
+.signature .block { flex:1; text-align:center; font-size:11px; }
+.signature .line { height:1px; background:#333; margin-bottom:6px; }
+footer { margin-top:24px; font-size:10px; color:var(--muted); text-align:center; }
+"""
+
+HTML_ORCAMENTO = """
+<html>
+<head>
+    <meta charset='utf-8'>
+</head>
+<body>
+    <header class="header">
+        <div class="logo">{% if logo_data_uri %}<img src="{{ logo_data_uri }}"/>{% endif %}</div>
+        <div class="company">
+            <div style="font-weight:700; font-size:14px;">{{ empresa.nome }}</div>
+            <div>{{ empresa.endereco }}</div>
+            <div>CNPJ: {{ empresa.cnpj }}</div>
+            <div>Tel: {{ empresa.telefone }} · Email: {{ empresa.email }}</div>
+        </div>
+    </header>
+    <section class="info-grid">
+        <div class="panel">
+            <h2>Dados do Orçamento</h2>
+            <p><strong>Número:</strong> #{{ numero }}</p>
+            <p><strong>Emissão:</strong> {{ orcamento.data_criacao.strftime('%d/%m/%Y %H:%M') }}</p>
+            <p><strong>Validade:</strong> {{ validade }}</p>
+            <p><strong>Responsável:</strong> {{ responsavel }}</p>
+        </div>
+        <div class="panel">
+            <h2>Empresa Prestadora</h2>
+            <p><strong>Razão Social:</strong> {{ empresa.nome }}</p>
+            <p><strong>CNPJ:</strong> {{ empresa.cnpj }}</p>
+            <p><strong>Endereço:</strong> {{ empresa.endereco }}</p>
+            <p><strong>Telefone:</strong> {{ empresa.telefone }}</p>
+            <p><strong>E-mail:</strong> {{ empresa.email }}</p>
+        </div>
+        <div class="panel">
+            <h2>Cliente</h2>
+            <p><strong>Nome:</strong> {{ cliente.nome }}</p>
+            <p><strong>CPF:</strong> {{ cliente.cpf }}</p>
+            <p><strong>Telefone:</strong> {{ cliente.telefone or 'Não informado' }}</p>
+            <p><strong>E-mail:</strong> {{ cliente.email }}</p>
+            <p><strong>Endereço:</strong> {{ cliente.endereco }}</p>
+        </div>
+    </section>
+    <h1>Serviços e Valores</h1>
+    <table class="items">
+        <thead>
+            <tr><th style="width:70px;">Qtd</th><th>Descrição do Item</th><th style="width:120px;">Valor Unitário</th><th style="width:140px;">Subtotal</th></tr>
+        </thead>
+        <tbody>
+        {% for rel in itens %}
+            <tr>
+                <td class='center'>{{ rel.quantidade }}</td>
+                <td><div class='title'>{{ rel.servico_nome or 'Serviço' }}</div>
+                <div class='desc'>{{ rel.servico_descricao or '' }}</div></td>
+                <td class='right'>{{ rel.valor_unitario | formatar_brl }}</td>
+                <td class='right'>{{ rel.subtotal | formatar_brl }}</td>
+            </tr>
+        {% else %}
+            <tr><td colspan='4' class='center'>Nenhum serviço vinculado</td></tr>
+        {% endfor %}
+        </tbody>
+    </table>
+    <div class="total">TOTAL GERAL: {{ orcamento.valor_total | formatar_brl }}</div>
+    <div class="notes">
+        <p>Este orçamento é válido por 15 dias corridos a partir da data de emissão. Os valores poderão ser ajustados caso haja alteração no escopo dos serviços.</p>
+    </div>
+    <div class="signature">
+        <div class="block">
+            <div class="line"></div>
+            <p>{{ empresa.nome }}</p>
+            <small>Responsável</small>
+        </div>
+        <div class="block">
+            <div class="line"></div>
+            <p>{{ cliente.nome }}</p>
+            <small>Cliente</small>
+        </div>
+    </div>
+    <footer>Documento gerado automaticamente pelo Planejador de Orçamentos.</footer>
+</body>
+</html>
+"""
+
+_ambiente_pdf = Environment(autoescape=True)
+_ambiente_pdf.filters['formatar_brl'] = formatar_brl
+PDF_TEMPLATE = _ambiente_pdf.from_string(HTML_ORCAMENTO)
@@ -0,0 +1,20 @@
+import os
+
+# Redis é opcional (pip install redis + REDIS_URL). Sem ele, quem usa o cliente
+# cai para uma alternativa em memória do próprio processo.
+try:
+    import redis
+    from redis import RedisError
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+    class RedisError(Exception):
+        """Substituto para os except quando o pacote redis não está instalado."""
+
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# Cliente compartilhado (None sem Redis). A conexão só é aberta no primeiro uso
+# e o pool do redis-py se refaz sozinho em cada worker após o fork.
+cliente_redis = redis.Redis.from_url(REDIS_URL) if REDIS_AVAILABLE and REDIS_URL else None
@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+import time
+
+# Com Redis (redis_utils) o cache é compartilhado entre os workers do gunicorn e
+# invalidar_usuario() vale para todos. Sem ele, cada processo tem o seu.
+from src.utils.redis_utils import RedisError, cliente_redis as _redis
+
+
+# Tempo (segundos) que os dados do usuário logado ficam em cache entre requisições.
+# Com Redis a invalidação alcança todos os workers, então o padrão pode ser bem maior.
+# 0 desativa o cache (toda requisição autenticada volta a consultar o banco).
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '1800' if _redis is not None else '30'))
+
+# Nunca vão para o cache (no Redis ficariam legíveis em JSON por quem acessa o servidor),
+# mesmo que quem chama mande o dict completo
+CAMPOS_FORA_DO_CACHE = frozenset({'senha'})
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _chave(id_usuario):
+    # v2: entradas gravadas antes (com o hash da senha) não são mais lidas e expiram pelo TTL
+    return f'usuario:v2:{id_usuario}'
+
+
+def obter_dados_usuario(id_usuario):
+    """Retorna um dict com as colunas do usuário em cache, ou None se ausente/expirado."""
+    if USER_CACHE_TTL <= 0:
+        return None
+    if _redis is not None:
+        try:
+            bruto = _redis.get(_chave(id_usuario))
+        except RedisError:
+            return None  # Redis fora do ar: segue pelo banco
+        return json.loads(bruto) if bruto is not None else None
+    with _lock:
+        item = _cache.get(id_usuario)
+        if item is None:
+            return None
+        expira_em, dados = item
+        if expira_em < time.monotonic():
+            del _cache[id_usuario]
+            return None
+        return dict(dados)
+
+
+def armazenar_dados_usuario(id_usuario, dados):
+    """Guarda as colunas do usuário (dict simples, sem objetos ORM) pelo tempo do TTL."""
+    if USER_CACHE_TTL <= 0:
+        return
+    dados = {chave: valor for chave, valor in dados.items() if chave not in CAMPOS_FORA_DO_CACHE}
+    if _redis is not None:
+        try:
+            _redis.setex(_chave(id_usuario), USER_CACHE_TTL, json.dumps(dados))
+        except RedisError:
+            pass
+        return
+    with _lock:
+        _cache[id_usuario] = (time.monotonic() + USER_CACHE_TTL, dados)
+
+
+def invalidar_usuario(id_usuario):
+    """Remove o usuário do cache (chamar após alterar perfil ou senha)."""
+    if _redis is not None:
+        try:
+            _redis.delete(_chave(id_usuario))
+        except RedisError:
+            pass
+        return
+    with _lock:
+        _cache.pop(id_usuario, None)
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timezone
+
+from flask import Response
+
+# ciso8601 é opcional (extensão em C, bem mais rápida para ler datas ISO 8601)
+try:
+    from ciso8601 import parse_datetime as _ler_iso
+    CISO8601_AVAILABLE = True
+except ImportError:
+    CISO8601_AVAILABLE = False
+
+
+# Tamanho máximo (caracteres) dos campos de texto, conforme as colunas dos modelos
+LIMITES_CLIENTE = {'nome': 80, 'telefone': 11, 'email': 50, 'endereco': 55}
+LIMITES_USUARIO = {'nome': 80, 'email': 50}
+
+ROTULOS_CAMPOS = {
+    'nome': 'Nome',
+    'telefone': 'Telefone',
+    'email': 'Email',
+    'endereco': 'Endereço',
+}
+
+
+def montar_erros_tamanho(limites):
+    """
+    Serializa uma única vez o JSON de erro de cada campo.
+    Guarda só os bytes: um Response novo é criado a cada uso (o CORS altera os headers da resposta).
+    """
+    return {
+        campo: json.dumps({'erro': f'{ROTULOS_CAMPOS[campo]} muito longo (máximo {limite} caracteres)'}).encode('utf-8')
+        for campo, limite in limites.items()
+    }
+
+
+def validar_tamanhos(dados, limites, erros):
+    """Retorna a resposta 400 do primeiro campo acima do limite, ou None se todos estiverem ok."""
+    for campo, limite in limites.items():
+        valor = dados.get(campo)
+        if valor and len(valor) > limite:
+            return Response(erros[campo], status=400, mimetype='application/json')
+    return None
+
+
+if not CISO8601_AVAILABLE:
+    def _ler_iso(texto):
+        # Python 3.11+ já aceita o sufixo 'Z'; só versões antigas precisam da troca
+        if texto[-1:] in ('Z', 'z'):
+            texto = texto[:-1] + '+00:00'
+        return datetime.fromisoformat(texto)
+
+
+def ler_data_hora(texto):
+    """
+    Converte data/hora ISO 8601 (ex.: '2025-01-31T14:00', '2025-01-31T17:00:00Z') em datetime.
+    Com fuso informado, devolve o horário em UTC sem fuso, como as colunas e o datetime.utcnow().
+    Levanta ValueError/TypeError se o texto for inválido.
+    """
+    valor = _ler_iso(texto)
+    if valor.tzinfo is not None:
+        valor = valor.astimezone(timezone.utc).replace(tzinfo=None)
+    return valor
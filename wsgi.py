@@ -0,0 +1,12 @@
+# ========================================
+# PONTO DE ENTRADA WSGI (PRODUÇÃO)
+# Sistema de Orçamentos de Serviços
+#
+# Uso:
+#   gunicorn -c gunicorn.conf.py wsgi:application
+# ========================================
+
+from src.main import app
+
+# Nome padrão procurado pelos servidores WSGI
+application = app